@@ -1,11 +1,19 @@
-import time, logging, os, sys, subprocess, random
+import time, logging, os, random, json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Any
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, jsonify, request, make_response, Response
 from flask_cors import CORS, cross_origin
 import torch
-import spacy
 import numpy as np
-from transformers import pipeline
+from zero_shot import classify_categories, MODES as CLASSIFY_MODES, AGGREGATES, CHUNK_AGGREGATE
+from label_index import INDEX as LABEL_INDEX
+from result_cache import ResultCache, make_key as make_cache_key
+import batching
+import doc_store
+import extractors
+import jobs
+import model_registry
+import token_cache
 
 # -------------------- Setup --------------------
 # Deterministic inference for consistent results
@@ -15,15 +23,8 @@ np.random.seed(0)
 random.seed(0)
 torch.use_deterministic_algorithms(False)
 
-# Ensure spaCy model is available (safe + idempotent)
-try:
-    spacy.load("en_core_web_sm")
-except Exception:
-    try:
-        subprocess.check_call([sys.executable, "-m", "spacy", "download", "en_core_web_sm"])
-        spacy.load("en_core_web_sm")
-    except Exception as e:
-        logging.warning("Failed to ensure spaCy model en_core_web_sm: %s", e)
+# spaCy (and its optional download) is handled by model_registry's background
+# loader, so importing this module never blocks on models.
 
 # Select runtime device
 DEVICE_ID = 0 if torch.cuda.is_available() else -1
@@ -42,9 +43,9 @@ CORS(app, resources={
             "https://cvscanner-api-eaaudbdneafub4e3.southafricanorth-01.azurewebsites.net"
         ],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin"],
+        "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "If-None-Match"],
         "supports_credentials": False,  # ✅ Changed to False - you're not using cookies
-        "expose_headers": ["Content-Type", "Content-Length"],
+        "expose_headers": ["Content-Type", "Content-Length", "ETag", "X-Cache", "Location"],
         "max_age": 3600
     }
 })
@@ -63,7 +64,8 @@ def after_request(response):
     if origin in allowed_origins:
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, If-None-Match'
+        response.headers['Access-Control-Expose-Headers'] = 'Content-Type, Content-Length, ETag, X-Cache, Location'
         response.headers['Access-Control-Max-Age'] = '3600'
     
     return response
@@ -76,31 +78,44 @@ if gunicorn_logger.handlers:
 # -------------------- Global Pipeline --------------------
 MODEL = None
 
-def get_pipeline():
-    """Load the BART model once and reuse it for all requests."""
+def get_pipeline(retry: bool = False):
+    """Return the zero-shot model, loading it on first use (shared with the background loader)."""
     global MODEL
     if MODEL is None:
-        print("🔄 Loading BART model once...")
-        MODEL = pipeline(
-            "zero-shot-classification",
-            model="facebook/bart-large-mnli",
-            device=DEVICE_ID
-        )
-        MODEL.model.eval()
-        print("✅ Model ready.")
+        MODEL = model_registry.load("zero_shot", retry=retry)
+        LABEL_INDEX.register(MODEL.tokenizer)
     return MODEL
 
-def warm_up_model():
-    """Preload the model to avoid cold start delay."""
-    print("Warming up zero-shot model...")
+def start_model_loading():
+    """Load all models in a background thread once this process is serving (idempotent)."""
+    model_registry.start_background()
+
+def init_label_index():
+    """Tokenize all configured labels up front and re-sync them on every category save."""
+    from config_store import load_categories, subscribe
     try:
-        get_pipeline()
+        LABEL_INDEX.sync(load_categories())
+        subscribe(LABEL_INDEX.sync)
     except Exception as e:
-        print(f"Warm-up failed: {e}")
-
-# Trigger warm-up immediately after app creation
+        print(f"Label index init failed: {e}")
+
+# -------------------- Result Cache --------------------
+# /upload_cv responses keyed by sha256(file) + category version + top_k + mode + aggregate
+# + extractor version
+RESULT_CACHE = ResultCache(
+    max_bytes=int(float(os.environ.get("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    spill_dir=os.environ.get("RESULT_CACHE_DIR") or None,
+)
+
+def init_result_cache():
+    """Stale entries are unreachable once the version changes; clearing just frees the space."""
+    from config_store import subscribe
+    subscribe(RESULT_CACHE.clear)
+
+# Models are not loaded here: see start_model_loading() / gunicorn.conf.py
 with app.app_context():
-    warm_up_model()
+    init_label_index()
+    init_result_cache()
 
 # -------------------- Lazy Imports --------------------
 def _lazy_import():
@@ -108,17 +123,6 @@ def _lazy_import():
     from cv_parser import parse_resume_from_bytes
     return load_categories, save_categories, parse_resume_from_bytes
 
-# -------------------- Utilities --------------------
-def extract_text_auto(file_bytes: bytes, filename: str) -> str:
-    name = (filename or "").lower()
-    if name.endswith(".txt"):
-        return file_bytes.decode("utf-8", errors="ignore")
-    return file_bytes.decode("utf-8", errors="ignore")
-
-def truncate_text(text: str, max_chars=2000) -> str:
-    """Reduce text length for faster inference."""
-    return text[:max_chars]
-
 # -------------------- Project Type Heuristic --------------------
 def infer_project_type(text: str, applied_labels: Dict[str, List[str]] | None = None):
     text_l = (text or "").lower()
@@ -197,6 +201,18 @@ def infer_project_type(text: str, applied_labels: Dict[str, List[str]] | None =
 def health():
     return {"status": "ok", "time": time.time()}, 200
 
+@app.before_request
+def ensure_models_loading():
+    # first request in this process (e.g. the platform's health probe) kicks off
+    # background loading; under gunicorn post_fork has usually done it already
+    start_model_loading()
+
+@app.get("/ready")
+def ready():
+    """Per-model load state; 503 until every model has either loaded or failed."""
+    state = model_registry.status()
+    return jsonify(state), (200 if state["ready"] else 503)
+
 @app.get("/startup_diagnostics")
 def startup_diagnostics():
     try:
@@ -209,97 +225,167 @@ def startup_diagnostics():
 def warmup():
     t0 = time.perf_counter()
     try:
-        get_pipeline()
+        get_pipeline(retry=True)
         ms = int((time.perf_counter() - t0) * 1000)
         return jsonify(status="ok", warmed=True, ms=ms)
     except Exception as e:
         app.logger.exception("Warmup failed")
         return jsonify(status="error", error=str(e)), 500
 
+def process_memory() -> Dict[str, Any]:
+    """RSS and PSS of this worker in MB (Linux). PSS splits pages shared with the
+    gunicorn master/other workers, so it shows what preloading saves."""
+    mem: Dict[str, Any] = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Private_Dirty"):
+                    mem[key.lower() + "_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return mem
+
+@app.get("/stats")
+def stats():
+    return jsonify(token_cache=token_cache.stats(), label_index=LABEL_INDEX.stats(),
+                   result_cache=RESULT_CACHE.stats(), microbatching=batching.stats(),
+                   models=model_registry.stats(), jobs=JOBS.stats(), doc_store=doc_store.stats(),
+                   memory=process_memory())
+
 @app.route("/")
 def root():
-    return "OK. Endpoints: /classify, /upload_cv, /parse_resume, /health"
+    return "OK. Endpoints: /classify, /upload_cv, /parse_resume, /health, /ready, /stats, /jobs/upload_cv, /jobs/parse_resume, /jobs/<id>"
 
 # -------------------- Admin Category --------------------
 @app.route("/admin/categories", methods=["GET"])
 def get_categories():
-    load_categories, _, _ = _lazy_import()
-    return jsonify(load_categories())
+    from config_store import snapshot
+    snap = snapshot()
+    # conditional GET: the category version doubles as a strong ETag
+    if request.if_none_match.contains(snap.version):
+        resp = make_response("", 304)
+    else:
+        resp = jsonify({cat: list(labels) for cat, labels in snap.categories.items()})
+    resp.set_etag(snap.version)
+    return resp
 
 @app.route("/admin/categories", methods=["POST"])
 def set_categories():
-    load_categories, save_categories, _ = _lazy_import()
+    from config_store import snapshot
+    _, save_categories, _ = _lazy_import()
     try:
         payload = request.get_json(force=True)
         if not isinstance(payload, dict):
             return make_response(jsonify({"status": "error", "detail": "Expected JSON object"}), 400)
         save_categories(payload)
-        return jsonify({"status": "saved", "categories": load_categories()})
+        snap = snapshot()
+        resp = jsonify({"status": "saved", "version": snap.version,
+                        "categories": {cat: list(labels) for cat, labels in snap.categories.items()}})
+        resp.set_etag(snap.version)
+        return resp
     except Exception as e:
         return make_response(jsonify({"status": "error", "detail": str(e)}), 400)
 
 # -------------------- Upload CV Endpoint --------------------
-@app.route("/upload_cv", methods=["POST"])
-@cross_origin()
-def upload_cv():
-    """
-    Handles CV uploads, classifies text into categories, and infers project type.
-    Combines performance optimization (cached model, truncated text)
-    with the original structured multi-category output format.
-    """
-    load_categories, _, _ = _lazy_import()
-
-    file = request.files.get("file")
-    if not file:
-        return make_response(jsonify({"status": "error", "detail": "No file uploaded."}), 400)
+def _error(detail: str, status: int):
+    return make_response(jsonify({"status": "error", "detail": detail}), status)
 
-    data = file.read()
-    if not data:
-        return make_response(jsonify({"status": "error", "detail": "Empty file."}), 400)
+def _model_unavailable(e: Exception):
+    """503 for a model that failed to load (see /ready); GET /warmup retries it."""
+    resp = _error(f"{str(e).rstrip('.')}. Retry later.", 503)
+    resp.headers["Retry-After"] = "30"
+    return resp
 
+def upload_options():
+    """Validate the /upload_cv form fields; returns (options, None) or (None, error response)."""
     # Get top_k (default = 3)
     try:
         top_k = int(request.values.get("top_k", request.args.get("top_k", 3)))
     except Exception:
         top_k = 3
 
-    # Extract and truncate text for faster inference
-    text = extract_text_auto(data, file.filename or "upload.txt")
-    text = truncate_text(text, 2000)
+    # Classification mode: "nli" (every label), "two_stage" (similarity prefilter + NLI re-rank)
+    # or "pruned" (stop scoring a category once its top_k is settled)
+    mode = request.values.get("mode", "nli")
+    if mode not in CLASSIFY_MODES:
+        return None, _error(f"Unknown mode '{mode}'. Use one of: {', '.join(CLASSIFY_MODES)}.", 400)
+
+    # How per-window scores of a long CV are combined per label ("none": first window only)
+    aggregate = request.values.get("aggregate", CHUNK_AGGREGATE)
+    if aggregate not in AGGREGATES:
+        return None, _error(f"Unknown aggregate '{aggregate}'. Use one of: {', '.join(AGGREGATES)}.", 400)
+    return {"top_k": top_k, "mode": mode, "aggregate": aggregate}, None
+
+def classify_upload(data: bytes | None, filename: str, top_k: int = 3, mode: str = "nli",
+                    aggregate: str = CHUNK_AGGREGATE, doc_id: str | None = None):
+    """
+    Classify one uploaded document (or the stored document `doc_id`) against
+    the current categories.
+    Returns (response payload, "HIT" or "MISS" for the result cache).
+    """
+    from config_store import snapshot
 
-    # Load categories
-    cats = load_categories()
+    # Load categories (categories and version come from the same snapshot)
+    snap = snapshot()
+    cats = snap.categories
     if not cats:
-        return make_response(jsonify({
-            "status": "error",
-            "detail": "No categories configured. Use POST /admin/categories first."
-        }), 409)
+        raise ValueError("No categories configured. Use POST /admin/categories first.")
+
+    # Repeat uploads of the same bytes against the same categories skip extraction and the model;
+    # the model id, quantization and backend are part of the key so a redeploy that changes
+    # them doesn't serve results spilled to RESULT_CACHE_DIR by the old model
+    doc_id = doc_id or doc_store.doc_id(data)
+    cache_key = make_cache_key(doc_id.encode("ascii"), snap.version, top_k, mode, aggregate,
+                               extractors.EXTRACTOR_VERSION, model_registry.ZERO_SHOT_MODEL,
+                               model_registry.MODEL_QUANTIZE or "fp32", model_registry.NLI_BACKEND)
+    cached = RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached, "HIT"
+
+    # Text comes from the doc store shared with /parse_resume: real extraction
+    # (format from the magic bytes, time budget and page cap per file) runs once
+    # per document; raises extractors.ExtractionError for unreadable uploads
+    started = time.time()
+    doc = _stored_document(doc_id) if data is None else doc_store.get_or_put(data, filename)
+    text = doc["raw_text"]
+    extraction = {**doc["extraction"], "reused": doc["stored"] < started}
+
+    # With aggregate=max/mean the full text is classified in overlapping token
+    # windows sized to the model; by default only the first window is scored
+    # (CHUNK_AGGREGATE=none)
 
     # Get cached model pipeline
     pipe = get_pipeline()
 
-    result = {}
-    for cat, labels in cats.items():
-        if not labels:
-            continue
-        try:
-            res = pipe(text, candidate_labels=labels, multi_label=True)
-        except Exception as e:
-            app.logger.warning(f"Classification failed for {cat}: {e}")
-            continue
+    # One batched NLI pass over every (window, label) pair across all categories;
+    # the CV text is tokenized once for the whole request
+    details: Dict[str, Any] = {}
+    with token_cache.scope():
+        classified = classify_categories(pipe, text, cats, mode=mode, aggregate=aggregate,
+                                         details=details, top_k=top_k)
+    chunking = {"aggregate": aggregate, "windows": details.get("windows"),
+                "duplicate_windows_skipped": details.get("duplicate_windows_skipped")}
 
+    result = {}
+    for cat, res in classified.items():
         labels_res = res.get("labels", [])
         scores_res = [max(float(s), 0.01) for s in res.get("scores", [])]
+        stages_res = res.get("stages", [])
         top_k_list = [
-            {"label": lbl, "score": sc}
-            for lbl, sc in zip(labels_res, scores_res[:top_k])
+            {"label": lbl, "score": sc, "stage": st}
+            for lbl, sc, st in zip(labels_res, scores_res[:top_k], stages_res)
         ]
 
         result[cat] = {
             "labels": labels_res,
             "scores": scores_res,
+            "stages": stages_res,
             "top_k": top_k_list
         }
+        if mode == "pruned":
+            # not scored by the model: listed so nothing is silently dropped
+            result[cat]["pruned"] = [lbl for lbl, st in zip(labels_res, stages_res) if st == "pruned"]
 
     # Build applied (top labels per category)
     applied = {cat: [x["label"] for x in info["top_k"]] for cat, info in result.items()}
@@ -310,28 +396,301 @@ def upload_cv():
     # Final structured response
     response_payload = {
         "status": "success",
+        "doc_id": doc_id,
         "top_k": top_k,
+        "mode": mode,
+        "extraction": extraction,
+        "chunking": chunking,
         "applied": applied,
         "raw": result,
         "best_fit_project_type": best_fit
     }
+    if mode == "pruned":
+        response_payload["pruning"] = {"rounds": details.get("rounds"), "pruned_labels": details.get("pruned_labels")}
+    RESULT_CACHE.put(cache_key, response_payload)
+    return response_payload, "MISS"
+
+def _stored_document(doc_id: str) -> Dict[str, Any]:
+    doc = doc_store.get(doc_id)
+    if doc is None:
+        raise LookupError("Unknown or expired doc_id. Upload the file again.")
+    return doc
+
+def _uploaded_file():
+    """
+    (bytes, filename, None) of the "file" field, or (None, filename, doc_id) for a
+    document already stored under the "doc_id" field; or (None, error response).
+    """
+    file = request.files.get("file")
+    if file:
+        data = file.read()
+        if not data:
+            return None, _error("Empty file.", 400)
+        return (data, file.filename, None), None
+    doc_id = request.values.get("doc_id")
+    if not doc_id:
+        return None, _error("No file uploaded.", 400)
+    doc = doc_store.get(doc_id)
+    if doc is None:
+        return None, _error("Unknown or expired doc_id. Upload the file again.", 404)
+    return (None, doc.get("filename"), doc_id), None
 
-    return jsonify(response_payload)
+@app.route("/upload_cv", methods=["POST"])
+@cross_origin()
+def upload_cv():
+    """
+    Handles CV uploads, classifies text into categories, and infers project type.
+    Combines performance optimization (cached model, token-window chunking)
+    with the original structured multi-category output format.
+    """
+    from config_store import snapshot
+
+    upload, err = _uploaded_file()
+    if err:
+        return err
+    opts, err = upload_options()
+    if err:
+        return err
+    if not snapshot().categories:
+        return _error("No categories configured. Use POST /admin/categories first.", 409)
+
+    try:
+        payload, cache_status = classify_upload(upload[0], upload[1], doc_id=upload[2], **opts)
+    except extractors.ExtractionError as e:
+        return _error(str(e), 422)
+    except LookupError as e:
+        return _error(str(e), 404)
+    except model_registry.ModelUnavailable as e:
+        return _model_unavailable(e)
+    resp = jsonify(payload)
+    resp.headers["X-Cache"] = cache_status
+    return resp
+
+# -------------------- Batch Upload --------------------
+# Many CVs per request: documents are classified concurrently, so their
+# (window, label) pairs land in the same micro-batched NLI forward passes
+BATCH_MAX_DOCS = int(os.environ.get("BATCH_MAX_DOCS", "200"))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "8"))
+
+def _batch_documents():
+    """
+    [(filename, bytes)] from repeated "file" fields, or from a JSONL body with one
+    {"text": ..., "id"/"filename": ...} object per line; or (None, error response).
+    """
+    files = [f for f in request.files.getlist("file") if f]
+    if files:
+        docs = [(f.filename, f.read()) for f in files]
+    else:
+        docs = []
+        for n, line in enumerate(request.get_data().decode("utf-8", errors="ignore").splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                return None, _error(f"Invalid JSON on line {n}: {e}", 400)
+            if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+                return None, _error(f"Line {n} has no \"text\" string.", 400)
+            name = str(item.get("filename") or item.get("id") or f"doc-{n}")
+            docs.append((name if name.lower().endswith(".txt") else f"{name}.txt", item["text"].encode("utf-8")))
+    if not docs:
+        return None, _error("No documents. Send \"file\" fields or a JSONL body of {\"text\": ...}.", 400)
+    if len(docs) > BATCH_MAX_DOCS:
+        return None, _error(f"Too many documents ({len(docs)}); the limit is {BATCH_MAX_DOCS}.", 413)
+    return docs, None
+
+@app.route("/upload_cv/batch", methods=["POST"])
+@cross_origin()
+def upload_cv_batch():
+    """
+    Classify many CVs in one request. Streams NDJSON: one line per document, in
+    completion order, with the /upload_cv body plus "index" (position in the
+    request), "filename" and "cache" (HIT/MISS), or status "error" and a detail.
+    """
+    from config_store import snapshot
+
+    docs, err = _batch_documents()
+    if err:
+        return err
+    opts, err = upload_options()
+    if err:
+        return err
+    if not snapshot().categories:
+        return _error("No categories configured. Use POST /admin/categories first.", 409)
+    try:
+        get_pipeline()  # load once up front rather than in every document thread
+    except model_registry.ModelUnavailable as e:
+        return _model_unavailable(e)
+
+    def run(data: bytes, filename: str):
+        if not data:
+            raise ValueError("Empty file.")
+        return classify_upload(data, filename, **opts)
+
+    def generate():
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(docs))),
+                                thread_name_prefix="batch") as pool:
+            futures = {pool.submit(run, data, filename): (i, filename) for i, (filename, data) in enumerate(docs)}
+            for fut in as_completed(futures):
+                index, filename = futures[fut]
+                try:
+                    payload, cache_status = fut.result()
+                    line = {"index": index, "filename": filename, "cache": cache_status, **payload}
+                except Exception as e:
+                    line = {"index": index, "filename": filename, "status": "error", "detail": str(e)}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
 
 # -------------------- Resume Parsing --------------------
+def parse_options():
+    """Validate the /parse_resume form fields; returns (options, None) or (None, error response)."""
+    from cv_parser import PARSE_MODES
+    # "heuristic" skips every model (served immediately, even while models are still loading)
+    mode = request.values.get("mode", "auto")
+    if mode not in PARSE_MODES:
+        return None, _error(f"Unknown mode '{mode}'. Use one of: {', '.join(PARSE_MODES)}.", 400)
+    return {"mode": mode}, None
+
+def parse_upload(data: bytes | None, filename: str, mode: str = "auto", doc_id: str | None = None) -> Dict[str, Any]:
+    _, _, parse_resume_from_bytes = _lazy_import()
+    timings: Dict[str, float] = {}
+    doc = _stored_document(doc_id) if data is None else doc_store.get_or_put(data, filename)
+    result = parse_resume_from_bytes(None, filename, mode, timings, doc)
+    return {"status": "success", "doc_id": doc["doc_id"], "filename": filename, "mode": mode,
+            "result": result, "timings_ms": timings}
+
+STREAM_FORMATS = ("ndjson", "sse")
+
+def parse_stream_format():
+    """"ndjson"/"sse" from ?stream= or the Accept header; None for a single JSON response."""
+    fmt = request.values.get("stream")
+    if fmt:
+        return fmt
+    accept = request.headers.get("Accept", "")
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return None
+
+def stream_parse(data: bytes | None, filename: str, mode: str, fmt: str, doc_id: str | None = None) -> Response:
+    """
+    Stream each parse stage (with its wall time) as soon as it finishes: personal
+    info and the other regex-based fields first, the model-backed ones last,
+    ending with the regular /parse_resume body as stage "result".
+    """
+    from cv_parser import parse_resume_stream
+
+    def encode(event: Dict[str, Any]) -> str:
+        body = json.dumps(event, ensure_ascii=False)
+        return f"event: {event['stage']}\ndata: {body}\n\n" if fmt == "sse" else body + "\n"
+
+    def generate():
+        timings: Dict[str, float] = {}
+        try:
+            t0 = time.perf_counter()
+            doc = _stored_document(doc_id) if data is None else doc_store.get_or_put(data, filename)
+            yield encode({"stage": "document", "data": {"doc_id": doc["doc_id"], "extraction": doc["extraction"]},
+                          "ms": round((time.perf_counter() - t0) * 1000, 1)})
+            for stage, value in parse_resume_stream(None, filename, mode, timings, doc):
+                if stage == "result":
+                    yield encode({"stage": stage, "status": "success", "doc_id": doc["doc_id"], "filename": filename,
+                                  "mode": mode, "result": value, "timings_ms": timings})
+                else:
+                    yield encode({"stage": stage, "data": value, "ms": timings.get(stage)})
+        except Exception as e:
+            yield encode({"stage": "error", "status": "error", "detail": str(e)})
+
+    resp = Response(generate(), mimetype="text/event-stream" if fmt == "sse" else "application/x-ndjson")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # let proxies pass each stage through
+    return resp
+
 @app.route("/parse_resume", methods=["POST"])
 @cross_origin()
 def parse_resume_endpoint():
-    _, _, parse_resume_from_bytes = _lazy_import()
-    file = request.files.get("file")
-    if not file:
-        return make_response(jsonify({"status": "error", "detail": "No file uploaded."}), 400)
+    upload, err = _uploaded_file()
+    if err:
+        return err
+    opts, err = parse_options()
+    if err:
+        return err
+    fmt = parse_stream_format()
+    if fmt is not None and fmt not in STREAM_FORMATS:
+        return _error(f"Unknown stream format '{fmt}'. Use one of: {', '.join(STREAM_FORMATS)}.", 400)
+    if fmt:
+        return stream_parse(upload[0], upload[1], opts["mode"], fmt, upload[2])
     try:
-        data = file.read()
-        result = parse_resume_from_bytes(data, file.filename)
-        return jsonify({"status": "success", "filename": file.filename, "result": result})
+        return jsonify(parse_upload(upload[0], upload[1], doc_id=upload[2], **opts))
+    except extractors.ExtractionError as e:
+        return _error(str(e), 422)
+    except LookupError as e:
+        return _error(str(e), 404)
     except Exception as e:
-        return make_response(jsonify({"status": "error", "detail": str(e)}), 500)
+        return _error(str(e), 500)
+
+# -------------------- Async Jobs --------------------
+# Same work as /upload_cv and /parse_resume, run by a bounded in-process worker
+# pool (reusing the loaded models) so the HTTP worker returns immediately
+JOBS = jobs.JobQueue()
+JOBS.register("upload_cv", lambda data, filename, **opts: classify_upload(data, filename, **opts)[0])
+JOBS.register("parse_resume", parse_upload)
+
+def _submit_job(kind: str, upload: tuple, opts: Dict[str, Any]):
+    data, filename, doc_id = upload
+    if doc_id:
+        opts = {**opts, "doc_id": doc_id}
+    callback_url = request.values.get("callback_url") or None
+    if callback_url and not jobs.callback_allowed(callback_url):
+        return _error("callback_url is not in JOB_CALLBACK_PREFIXES.", 400)
+    try:
+        state = JOBS.submit(kind, {"data": data, "filename": filename, **opts}, callback_url,
+                            meta={"filename": filename, **opts})
+    except jobs.QueueFull as e:
+        resp = _error(f"Job queue is full ({e}). Retry later.", 503)
+        resp.headers["Retry-After"] = "5"
+        return resp
+    resp = make_response(jsonify({"status": state["status"], "job_id": state["id"],
+                                  "status_url": f"/jobs/{state['id']}"}), 202)
+    resp.headers["Location"] = f"/jobs/{state['id']}"
+    return resp
+
+@app.route("/jobs/upload_cv", methods=["POST"])
+@cross_origin()
+def upload_cv_job():
+    from config_store import snapshot
+
+    upload, err = _uploaded_file()
+    if err:
+        return err
+    opts, err = upload_options()
+    if err:
+        return err
+    if not snapshot().categories:
+        return _error("No categories configured. Use POST /admin/categories first.", 409)
+    return _submit_job("upload_cv", upload, opts)
+
+@app.route("/jobs/parse_resume", methods=["POST"])
+@cross_origin()
+def parse_resume_job():
+    upload, err = _uploaded_file()
+    if err:
+        return err
+    opts, err = parse_options()
+    if err:
+        return err
+    return _submit_job("parse_resume", upload, opts)
+
+@app.get("/jobs/<job_id>")
+@cross_origin()
+def get_job(job_id):
+    """status is queued / running / done / failed; result holds the sync endpoint's body once done."""
+    state = jobs.get(job_id)
+    if state is None:
+        return _error("Unknown job id.", 404)
+    state.pop("pid", None)
+    return jsonify(state)
 
 # -------------------- ASGI Adapter --------------------
 try:
@@ -342,4 +701,5 @@ except Exception:
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "5000"))
+    start_model_loading()
     app.run(host="0.0.0.0", port=port)
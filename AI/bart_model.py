@@ -1,17 +1,20 @@
 # Lightweight zero-shot classifier using MiniLM instead of BART.
 from typing import Dict, List, Tuple
 import logging
+import os
 
 _pipeline = None
 _pipeline_error = None
 
 try:
-    from transformers import pipeline  # type: ignore
+    import model_registry
+    from zero_shot import classify_categories
     # 🪶 much smaller and faster than facebook/bart-large-mnli
-    _pipeline = pipeline(
+    # (loaded through the registry so MODEL_QUANTIZE applies here too)
+    _pipeline = model_registry.get_pipeline(
         "zero-shot-classification",
-        model="cross-encoder/nli-miniLM2-L6-v2",
-        device=-1   # use CPU; your main app already auto-selects GPU if available
+        os.environ.get("MINILM_MODEL", "cross-encoder/nli-miniLM2-L6-v2"),
+        -1   # use CPU; your main app already auto-selects GPU if available
     )
 except Exception as e:
     _pipeline = None
@@ -19,12 +22,15 @@ except Exception as e:
     logging.getLogger("bart_model").warning("Failed to load MiniLM pipeline: %s", e)
 
 
-def classify_text_by_categories(text: str, categories, top_k: int = 3):
+def classify_text_by_categories(text: str, categories, top_k: int = 3, mode: str = "nli"):
     """
     Zero-shot classifier with normalized scores.
     Supports:
       - categories as dict: { "Skills": ["Python","Java"], ... }
       - categories as list: ["Python","Java",...]
+    mode="two_stage" ranks dict labels by TF-IDF similarity first and only
+    re-scores the top candidates per category with NLI, mode="pruned" stops
+    scoring a category once its top_k is settled (see zero_shot).
     """
     try:
         top_k = int(top_k or 3)
@@ -35,21 +41,26 @@ def classify_text_by_categories(text: str, categories, top_k: int = 3):
     if _pipeline is not None:
         try:
             if isinstance(categories, dict):
+                classified = classify_categories(_pipeline, text, categories, mode=mode, top_k=top_k)
                 out = {}
                 for cat, labels in categories.items():
-                    if not labels:
-                        out[cat] = {"labels": [], "scores": [], "top_k": []}
+                    if not labels or cat not in classified:
+                        out[cat] = {"labels": [], "scores": [], "stages": [], "top_k": []}
                         continue
-                    res = _pipeline(text, candidate_labels=labels, multi_label=True)
+                    res = classified[cat]
+                    stage_of = dict(zip(res["labels"], res["stages"]))
                     pairs = list(zip(res["labels"], map(float, res["scores"])))
-                    # normalize
-                    total = sum(score for _, score in pairs) or 1.0
-                    pairs = [(lbl, score / total) for lbl, score in pairs]
-                    top = sorted(pairs, key=lambda p: p[1], reverse=True)[:top_k]
+                    # normalize over the NLI probabilities only; "similarity" scores and
+                    # "pruned" ceilings are not probabilities and are passed through as-is
+                    total = sum(score for lbl, score in pairs if stage_of[lbl] == "nli") or 1.0
+                    pairs = [(lbl, score / total if stage_of[lbl] == "nli" else score) for lbl, score in pairs]
+                    # order is already NLI-first, then by score
+                    top = pairs[:top_k]
                     out[cat] = {
                         "labels": [lbl for lbl, _ in pairs],
                         "scores": [sc for _, sc in pairs],
-                        "top_k": [{"label": lbl, "score": sc} for lbl, sc in top],
+                        "stages": [stage_of[lbl] for lbl, _ in pairs],
+                        "top_k": [{"label": lbl, "score": sc, "stage": stage_of[lbl]} for lbl, sc in top],
                     }
                 return out
 
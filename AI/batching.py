@@ -0,0 +1,144 @@
+# Dynamic micro-batching for model calls shared across request threads.
+# Handlers submit single items and block on a Future; one scheduler thread per
+# batcher waits up to MICROBATCH_WINDOW_MS (or until max_batch items are
+# pending), runs them through the model as one padded batch and routes each
+# result back to its caller. Items are only batched with others that share
+# the same group key (e.g. identical generate() kwargs).
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger("batching")
+
+MICROBATCH_WINDOW_MS = float(os.environ.get("MICROBATCH_WINDOW_MS", "10"))
+
+_HIST_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def enabled() -> bool:
+    return MICROBATCH_WINDOW_MS > 0
+
+
+class MicroBatcher:
+    def __init__(self, name: str, fn: Callable[[List[Any]], List[Any]], max_batch: int,
+                 window_ms: float | None = None, group_key: Optional[Callable[[Any], Hashable]] = None):
+        self.name = name
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.window = (MICROBATCH_WINDOW_MS if window_ms is None else window_ms) / 1000.0
+        self.group_key = group_key or (lambda item: None)
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._stats = {"items": 0, "batches": 0, "errors": 0, "max_queue_depth": 0, "wait_ms_total": 0.0}
+        self._hist: Dict[str, int] = {}
+
+    def _ensure_thread(self) -> None:
+        # (re)start after fork: threads do not survive into gunicorn workers
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name=f"microbatch-{self.name}", daemon=True)
+            self._thread.start()
+
+    def submit_many(self, items: List[Any]) -> List[Any]:
+        """Queue items and block until all their results are back (in order)."""
+        if not items:
+            return []
+        self._ensure_thread()
+        now = time.perf_counter()
+        futures = []
+        for item in items:
+            fut: Future = Future()
+            self._queue.put((item, fut, now))
+            futures.append(fut)
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return [f.result() for f in futures]
+
+    def submit(self, item: Any) -> Any:
+        return self.submit_many([item])[0]
+
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        pending = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(pending) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                pending.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return pending
+
+    def _loop(self) -> None:
+        while True:
+            pending = self._collect()
+            groups: Dict[Hashable, List[Tuple[Any, Future, float]]] = {}
+            for entry in pending:
+                groups.setdefault(self.group_key(entry[0]), []).append(entry)
+            for group in groups.values():
+                self._run(group)
+
+    def _run(self, group: List[Tuple[Any, Future, float]]) -> None:
+        started = time.perf_counter()
+        try:
+            results = self.fn([item for item, _, _ in group])
+            for (_, fut, _), res in zip(group, results):
+                fut.set_result(res)
+        except Exception as e:
+            logger.warning("Micro-batch %s failed (%d items): %s", self.name, len(group), e)
+            with self._lock:
+                self._stats["errors"] += 1
+            for _, fut, _ in group:
+                if not fut.done():
+                    fut.set_exception(e)
+        bucket = next((str(b) for b in _HIST_BUCKETS if len(group) <= b), f">{_HIST_BUCKETS[-1]}")
+        with self._lock:
+            self._stats["items"] += len(group)
+            self._stats["batches"] += 1
+            self._stats["wait_ms_total"] += sum((started - t) * 1000 for _, _, t in group)
+            self._hist[bucket] = self._hist.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = self._stats["items"]
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._stats["max_queue_depth"],
+                "items": items,
+                "batches": self._stats["batches"],
+                "errors": self._stats["errors"],
+                "avg_batch_size": round(items / self._stats["batches"], 2) if self._stats["batches"] else 0.0,
+                "avg_wait_ms": round(self._stats["wait_ms_total"] / items, 2) if items else 0.0,
+                "batch_size_histogram": dict(self._hist),
+            }
+
+
+_registry: Dict[str, MicroBatcher] = {}
+_registry_lock = threading.Lock()
+
+
+def get_batcher(name: str, factory: Callable[[], MicroBatcher]) -> MicroBatcher:
+    """Process-wide batcher for `name`, created on first use."""
+    batcher = _registry.get(name)
+    if batcher is None:
+        with _registry_lock:
+            batcher = _registry.get(name)
+            if batcher is None:
+                batcher = _registry[name] = factory()
+    return batcher
+
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": enabled(), "window_ms": MICROBATCH_WINDOW_MS,
+            "batchers": {name: b.stats() for name, b in list(_registry.items())}}
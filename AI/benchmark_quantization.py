@@ -0,0 +1,164 @@
+# Compare fp32 and dynamic int8 (MODEL_QUANTIZE=int8) inference on a fixed corpus of CVs.
+#
+#   python benchmark_quantization.py [--corpus DIR] [--runs 3] [--generation] [--json]
+#
+# Each precision runs in its own subprocess so peak RSS is measured cleanly.
+# Reports model load time, per-document latency (mean / p50 / p95), peak RSS,
+# and the drift of int8 against fp32: max/mean absolute difference over every
+# category/label score and how many categories change their top label.
+# The corpus is every .pdf/.docx/.txt in --corpus (default: CV.pdf next to this
+# script) plus the built-in sample CVs below; categories come from categories.json.
+import os, sys, json, glob, time, argparse, statistics, subprocess
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_CVS = [
+    "Jane Smith\njane.smith@example.com\nSenior Backend Developer with 7 years of experience building "
+    "Spring Boot and .NET services on AWS and Azure. Led a team of five using Scrum. PostgreSQL, Redis, "
+    "Docker, Kubernetes. BSc Computer Science. AWS Certified Cloud Practitioner.",
+    "Thabo Nkosi\nJunior frontend developer. React, Angular, JavaScript and Figma. Internship at a retail "
+    "company building customer dashboards. Diploma in Information Technology. Strong communication and "
+    "teamwork, comfortable with Git and Jira in a Kanban team.",
+    "Dr. Maria Lopez\nPhD in Machine Learning. Data scientist in healthcare, Python, PyTorch and GCP. "
+    "Published research on medical imaging. Mentors interns, problem solving, leadership. MongoDB, MySQL.",
+    "Ahmed Patel\nDevOps engineer in telecom. Terraform, Jenkins, Azure, GCP, Postman for API testing. "
+    "Mid-level, 4 years. Waterfall and Agile projects. Matric, Scrum Master certification, PMP.",
+]
+
+
+def load_corpus(corpus_dir: str) -> List[str]:
+    import extractors
+    texts = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*"))):
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in (".pdf", ".docx", ".txt"):
+            continue
+        try:
+            with open(path, "rb") as f:
+                texts.append(extractors.extract(f.read())[0])  # as /upload_cv
+        except Exception as e:
+            print(f"[bench] skipping {path}: {e}", file=sys.stderr)
+    return texts + SAMPLE_CVS
+
+
+def run_child(precision: str, corpus_dir: str, runs: int, generation: bool) -> Dict:
+    """Load the models at `precision`, run the corpus and return timings/scores."""
+    os.environ["MODEL_QUANTIZE"] = "int8" if precision == "int8" else ""
+    import resource
+    import model_registry
+    from zero_shot import classify_categories, CHUNK_AGGREGATE
+
+    with open(os.environ.get("CATEGORIES_JSON", os.path.join(HERE, "categories.json")), encoding="utf-8") as f:
+        categories = json.load(f)
+    texts = load_corpus(corpus_dir)
+
+    t0 = time.perf_counter()
+    pipe = model_registry.get_pipeline("zero-shot-classification", model_registry.ZERO_SHOT_MODEL, -1)
+    load_s = time.perf_counter() - t0
+
+    latencies, scores = [], []
+    for run in range(runs):
+        for text in texts:
+            t0 = time.perf_counter()
+            res = classify_categories(pipe, text, categories, aggregate=CHUNK_AGGREGATE)  # as /upload_cv
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if run == 0:
+                scores.append({cat: dict(zip(r["labels"], r["scores"])) for cat, r in res.items()})
+
+    out = {
+        "precision": precision,
+        "documents": len(texts),
+        "load_s": round(load_s, 2),
+        "latency_ms": _summary(latencies),
+        "scores": scores,
+    }
+
+    if generation:
+        from cv_parser import run_generation
+        summarizer = model_registry.get_pipeline("summarization", model_registry.SUMMARIZER_MODEL, -1)
+        gen_lat, summaries = [], []
+        for text in texts:
+            t0 = time.perf_counter()
+            summaries.append(run_generation(summarizer, text, 2000, max_length=150, min_length=40, do_sample=False))
+            gen_lat.append((time.perf_counter() - t0) * 1000)
+        out["generation_ms"] = _summary(gen_lat)
+        out["summaries"] = summaries
+
+    out["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    out["models"] = model_registry.stats()
+    return out
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "mean": round(statistics.fmean(ordered), 1),
+        "p50": round(ordered[len(ordered) // 2], 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+    }
+
+
+def drift(base: List[Dict], other: List[Dict]) -> Dict:
+    diffs, flips, cats = [], 0, 0
+    for doc_a, doc_b in zip(base, other):
+        for cat, labels in doc_a.items():
+            other_labels = doc_b.get(cat, {})
+            diffs.extend(abs(score - other_labels.get(lbl, 0.0)) for lbl, score in labels.items())
+            if labels and other_labels:
+                cats += 1
+                flips += max(labels, key=labels.get) != max(other_labels, key=other_labels.get)
+    return {
+        "max_abs": round(max(diffs), 4) if diffs else 0.0,
+        "mean_abs": round(statistics.fmean(diffs), 4) if diffs else 0.0,
+        "top_label_changes": f"{flips}/{cats}",
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare fp32 and int8 inference on a corpus of CVs.")
+    ap.add_argument("--corpus", default=HERE, help="directory of .pdf/.docx/.txt CVs")
+    ap.add_argument("--runs", type=int, default=3, help="passes over the corpus for latency")
+    ap.add_argument("--generation", action="store_true", help="also time the bart-large-cnn summarizer")
+    ap.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    ap.add_argument("--child", choices=("fp32", "int8"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.corpus, args.runs, args.generation)))
+        return
+
+    results = {}
+    for precision in ("fp32", "int8"):
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", precision,
+               "--corpus", args.corpus, "--runs", str(args.runs)] + (["--generation"] if args.generation else [])
+        proc = subprocess.run(cmd, cwd=HERE, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(f"[bench] {precision} run failed")
+        results[precision] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    report = {
+        precision: {k: r[k] for k in ("documents", "load_s", "latency_ms", "generation_ms", "peak_rss_mb") if k in r}
+        for precision, r in results.items()
+    }
+    report["int8_vs_fp32"] = drift(results["fp32"]["scores"], results["int8"]["scores"])
+    if args.generation:
+        same = sum(a == b for a, b in zip(results["fp32"]["summaries"], results["int8"]["summaries"]))
+        report["int8_vs_fp32"]["identical_summaries"] = f"{same}/{len(results['fp32']['summaries'])}"
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for precision in ("fp32", "int8"):
+        r = report[precision]
+        line = (f"{precision}: load {r['load_s']}s, classify mean {r['latency_ms']['mean']}ms "
+                f"p50 {r['latency_ms']['p50']}ms p95 {r['latency_ms']['p95']}ms, peak RSS {r['peak_rss_mb']}MB")
+        if "generation_ms" in r:
+            line += f", summarize mean {r['generation_ms']['mean']}ms"
+        print(line)
+    print("int8 vs fp32 drift:", report["int8_vs_fp32"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Parity check between the PyTorch and ONNX Runtime zero-shot backends.
+#
+#   python check_onnx_parity.py [--model NAME] [--corpus DIR] [--atol 1e-4]
+#
+# Exports NAME (default: ZERO_SHOT_MODEL) through onnx_backend if it is not
+# cached yet, then classifies the benchmark corpus against categories.json with
+# both backends, through the HF pipeline (single- and multi-label, as used by
+# bart_model and the fallback path) and through zero_shot's batched scoring
+# (score_pairs, and score_chunked for aggregate=max, as used by /upload_cv).
+# These are called directly: classify_categories falls back to the plain
+# pipeline on any error, which would hide a broken ONNX session. Every label
+# score must agree within --atol and the label order must match wherever scores
+# differ by more than --atol.
+# Exits non-zero on any mismatch.
+import os, sys, json, argparse
+
+# both pipelines share a model name, so keep them out of the shared micro-batcher
+os.environ["MICROBATCH_WINDOW_MS"] = "0"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def compare(where: str, base: dict, other: dict, atol: float, problems: list) -> float:
+    """Compare two {"labels", "scores"} results; returns the largest score difference."""
+    a = dict(zip(base["labels"], base["scores"]))
+    b = dict(zip(other["labels"], other["scores"]))
+    if set(a) != set(b):
+        problems.append(f"{where}: label sets differ")
+        return float("inf")
+    worst = max((abs(a[lbl] - b[lbl]) for lbl in a), default=0.0)
+    if worst > atol:
+        problems.append(f"{where}: max score difference {worst:.2e} > {atol:.0e}")
+    for x, y in zip(base["labels"], other["labels"]):
+        if x != y and abs(a[x] - a[y]) > atol:
+            problems.append(f"{where}: label order differs ({base['labels']} vs {other['labels']})")
+            break
+    return worst
+
+
+def main(args) -> int:
+    import transformers
+    import model_registry
+    import onnx_backend
+    from zero_shot import score_chunked, score_pairs
+    from benchmark_quantization import load_corpus
+
+    name = args.model or model_registry.ZERO_SHOT_MODEL
+    tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+    torch_pipe = transformers.pipeline("zero-shot-classification", model=name, tokenizer=tokenizer, device=-1)
+    onnx_pipe = transformers.pipeline("zero-shot-classification", model=onnx_backend.load(name, tokenizer),
+                                      tokenizer=tokenizer, device=-1, framework="pt")
+
+    with open(os.environ.get("CATEGORIES_JSON", os.path.join(HERE, "categories.json")), encoding="utf-8") as f:
+        categories = {cat: labels for cat, labels in json.load(f).items() if labels}
+    texts = load_corpus(args.corpus)
+
+    problems, worst = [], 0.0
+    for i, text in enumerate(texts):
+        for cat, labels in categories.items():
+            for multi in (True, False):
+                base = torch_pipe(text, candidate_labels=labels, multi_label=multi)
+                other = onnx_pipe(text, candidate_labels=labels, multi_label=multi)
+                worst = max(worst, compare(f"doc {i} {cat} pipeline multi_label={multi}", base, other, args.atol, problems))
+        for cat, labels in categories.items():
+            pairs = [(text, label) for label in labels]
+            for where, score in (("score_pairs", lambda pipe: score_pairs(pipe, pairs)),
+                                 ("score_chunked", lambda pipe: score_chunked(pipe, text, labels, "max"))):
+                base = {"labels": labels, "scores": score(torch_pipe)}
+                other = {"labels": labels, "scores": score(onnx_pipe)}
+                worst = max(worst, compare(f"doc {i} {cat} {where}", base, other, args.atol, problems))
+
+    print(f"[parity] {name}: {len(texts)} documents, {len(categories)} categories, "
+          f"max score difference {worst:.2e} (atol {args.atol:.0e})")
+    for p in problems[:20]:
+        print("[parity] MISMATCH", p)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Check ONNX Runtime scores against the PyTorch zero-shot pipeline.")
+    ap.add_argument("--model", help="checkpoint (default: ZERO_SHOT_MODEL)")
+    ap.add_argument("--corpus", default=HERE, help="directory of .pdf/.docx/.txt CVs")
+    ap.add_argument("--atol", type=float, default=1e-4, help="allowed absolute score difference")
+    args = ap.parse_args()
+    sys.exit(main(args))
@@ -1,23 +1,95 @@
 # Manages dynamic categories/tags in a JSON file (no hardcoding).
-import json, os, threading, time
-from typing import Dict, List
+# The parsed file is kept in memory as an immutable snapshot with a content
+# version; reads are lock-free and the file is only re-stat'ed every
+# CATEGORIES_REVALIDATE_SEC seconds (re-parsed only if mtime/size changed).
+import json, os, threading, time, logging, hashlib
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
 
 CONFIG_PATH = os.environ.get("CATEGORIES_JSON", "categories.json")
+REVALIDATE_SEC = float(os.environ.get("CATEGORIES_REVALIDATE_SEC", "2.0"))
 _lock = threading.Lock()
 
 _DEFAULT: Dict[str, List[str]] = {}  # start empty; admin fills via API
+_subscribers: List[Callable[[Dict[str, List[str]]], None]] = []
 
-def _ensure_file():
-    if not os.path.exists(CONFIG_PATH):
-        save_categories(_DEFAULT)
+class Snapshot(NamedTuple):
+    categories: Mapping[str, Tuple[str, ...]]  # read-only view
+    version: str                               # content hash, used as ETag
+    mtime: float
+    size: int
+    checked_at: float                          # time.monotonic() of last stat
 
-def load_categories() -> Dict[str, List[str]]:
-    _ensure_file()
+_snapshot: Optional[Snapshot] = None
+
+def subscribe(callback: Callable[[Dict[str, List[str]]], None]) -> None:
+    """Call `callback(categories)` whenever categories are saved or change on disk."""
+    _subscribers.append(callback)
+
+def _notify(categories: Dict[str, List[str]]) -> None:
+    for callback in list(_subscribers):
+        try:
+            callback(categories)
+        except Exception as e:
+            logging.getLogger("config_store").warning("Category subscriber failed: %s", e)
+
+def _to_dict(categories: Mapping[str, Tuple[str, ...]]) -> Dict[str, List[str]]:
+    return {cat: list(labels) for cat, labels in categories.items()}
+
+def _build(raw: bytes, st: os.stat_result) -> Snapshot:
+    data = json.loads(raw.decode("utf-8"))
+    frozen = MappingProxyType({str(cat): tuple(labels) for cat, labels in data.items()})
+    return Snapshot(frozen, hashlib.sha1(raw).hexdigest()[:16], st.st_mtime, st.st_size, time.monotonic())
+
+def _revalidate() -> Snapshot:
+    global _snapshot
+    changed = None
     with _lock:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        snap = _snapshot
+        if snap is not None and time.monotonic() - snap.checked_at < REVALIDATE_SEC:
+            return snap  # another thread revalidated while we waited
+        if not os.path.exists(CONFIG_PATH):
+            snap = _write(_DEFAULT)
+            changed = _to_dict(snap.categories)
+        else:
+            st = os.stat(CONFIG_PATH)
+            if snap is not None and (st.st_mtime, st.st_size) == (snap.mtime, snap.size):
+                snap = snap._replace(checked_at=time.monotonic())
+            else:
+                with open(CONFIG_PATH, "rb") as f:
+                    fresh = _build(f.read(), st)
+                if snap is not None and fresh.version != snap.version:
+                    changed = _to_dict(fresh.categories)
+                snap = fresh
+        _snapshot = snap
+    if changed is not None:
+        _notify(changed)
+    return snap
+
+def snapshot() -> Snapshot:
+    """Current categories snapshot; lock-free unless the revalidation interval has passed."""
+    snap = _snapshot
+    if snap is not None and time.monotonic() - snap.checked_at < REVALIDATE_SEC:
+        return snap
+    return _revalidate()
+
+def load_categories() -> Dict[str, List[str]]:
+    return _to_dict(snapshot().categories)
+
+def version() -> str:
+    return snapshot().version
+
+def _write(norm: Dict[str, List[str]]) -> Snapshot:
+    """Atomically replace the JSON file and return its snapshot (caller holds _lock)."""
+    raw = json.dumps(norm, indent=2, ensure_ascii=False).encode("utf-8")
+    tmp = f"{CONFIG_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    os.replace(tmp, CONFIG_PATH)
+    return _build(raw, os.stat(CONFIG_PATH))
 
 def save_categories(payload: Dict[str, List[str]]) -> None:
+    global _snapshot
     # normalize: strip empties, dedupe, keep order
     norm: Dict[str, List[str]] = {}
     for cat, labels in payload.items():
@@ -31,9 +103,8 @@ def save_categories(payload: Dict[str, List[str]]) -> None:
             out.append(xx)
         norm[str(cat).strip()] = out
     with _lock:
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(norm, f, indent=2, ensure_ascii=False)
+        _snapshot = _write(norm)
+    _notify(norm)
 
 def last_modified() -> float:
-    _ensure_file()
-    return os.path.getmtime(CONFIG_PATH)
\ No newline at end of file
+    return snapshot().mtime
@@ -1,11 +1,17 @@
 import os
 import re
+import time
 import logging
-import tempfile
-from transformers import pipeline
 from typing import Dict
 import torch
-import spacy
+import batching
+import doc_store
+import model_registry
+import stage_dag
+from sections import INDEX_VERSION as SECTION_INDEX_VERSION, SectionIndex
+from extractors import Source, open_document, pdf_text
+import token_cache
+from parse_cache import StageMemo, effective_versions, mark_degraded, open_memo
 try:
     import docx
     _HAS_PYDOCX = True
@@ -21,66 +27,101 @@ except Exception:
 # removed top-level transformers import to avoid import-time failures
 # transformers.pipeline will be imported lazily inside AIExtractor
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 
 
 # ---------- Logging ----------
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# ---------- spaCy (optional) ----------
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    logger.warning("spaCy model 'en_core_web_sm' not found. Install with: python -m spacy download en_core_web_sm")
-    nlp = None
-
-# ---------- Summarizer (optional) ----------
-try:
-    summarizerPipeline = pipeline(
-        "summarization",
-        model="facebook/bart-large-cnn",
-        device=0 if torch.cuda.is_available() else -1
-    )
-    logger.info("Summarization model loaded successfully")
-except Exception as e:
-    logger.warning(f"Could not load summarization model: {e}")
-    summarizerPipeline = None
-
-try:
-    extractor = pipeline(
-        "text2text-generation",
-        model="facebook/bart-large-cnn",
-        device=0 if torch.cuda.is_available() else -1
-    )
-    logger.info("Text extraction model loaded successfully")
-except Exception as e:
-    logger.warning(f"Could not load text extraction model: {e}")
-    extractor = None
+# ---------- Models (optional, lazy) ----------
+# The summarizer and extractor (both facebook/bart-large-cnn by default) are
+# loaded on first use through model_registry, not at import time (spaCy is only
+# loaded by the registry's background warm-up); parse modes: "auto" uses them (loading if needed), "heuristic" never touches them.
+PARSE_MODES = ("auto", "heuristic")
+
+# ---------- Generation helper ----------
+GEN_BATCH_SIZE = int(os.environ.get("GEN_BATCH_SIZE", "8"))
+
+def _generate_batch(pipe, items) -> List[str]:
+    """Generate for several prompts sharing the same generate() kwargs in one padded call."""
+    tokenizer, model = pipe.tokenizer, pipe.model
+    generate_kwargs = dict(items[0][1])
+    width = max(len(ids) for ids, _ in items)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    input_ids = torch.tensor([ids + [pad_id] * (width - len(ids)) for ids, _ in items], dtype=torch.long, device=model.device)
+    attention_mask = torch.tensor([[1] * len(ids) + [0] * (width - len(ids)) for ids, _ in items], dtype=torch.long, device=model.device)
+    with torch.no_grad():
+        output = model.generate(input_ids=input_ids, attention_mask=attention_mask, **generate_kwargs)
+    return [tokenizer.decode(seq, skip_special_tokens=True, clean_up_tokenization_spaces=False) for seq in output]
+
+def run_generation(pipe, text: str, max_chars: int | None = None, prefix: str = "", suffix: str = "",
+                   **generate_kwargs) -> str:
+    """
+    Run a summarization/text2text pipeline on `prefix text[:max_chars] suffix`.
+    The CV text is tokenized once per request through token_cache and the prompt
+    ids are assembled around it, instead of re-tokenizing every f-string prompt.
+    With micro-batching enabled, prompts from concurrent requests that share the
+    same generate() kwargs are run together.
+    """
+    try:
+        tokenizer, model = pipe.tokenizer, pipe.model
+        prefix = prefix.rstrip()
+        head = token_cache.encode(tokenizer, prefix) if prefix else []
+        tail = token_cache.encode(tokenizer, suffix) if suffix else []
+        # leading space so the first word tokenizes as it would mid-prompt
+        body = token_cache.encode(tokenizer, " " + text, None if max_chars is None else max_chars + 1)
+
+        limit = getattr(tokenizer, "model_max_length", None) or 0
+        if not limit or limit > 100_000:
+            limit = getattr(model.config, "max_position_embeddings", 1024)
+        room = limit - tokenizer.num_special_tokens_to_add(pair=False)
+        budget = max(room - len(head) - len(tail), 0)
+        ids = tokenizer.build_inputs_with_special_tokens((head + body[:budget] + tail)[:room])
+        item = (ids, tuple(sorted(generate_kwargs.items())))
+
+        if batching.enabled():
+            name = f"gen:{getattr(model, 'name_or_path', type(model).__name__)}"
+            batcher = batching.get_batcher(name, lambda: batching.MicroBatcher(
+                name, lambda items: _generate_batch(pipe, items), GEN_BATCH_SIZE, group_key=lambda it: it[1]))
+            return batcher.submit(item)
+        return _generate_batch(pipe, [item])[0]
+    except Exception:
+        mark_degraded()  # the calling stage falls back to its heuristic: don't memoize it
+        raise
 
 # ---------- File text extractors ----------
-def extract_text_from_pdf(pdf_path: str) -> str:
+# Extractors take a path, the raw bytes, or a binary file-like object, read
+# in memory through extractors.open_document (no temp files).
+def extract_text_from_pdf(source: Source) -> str:
     if not _HAS_PDFMINER:
         raise RuntimeError("pdfminer.six is not installed. Install with: pip install pdfminer.six")
-    return extract_pdf_text(pdf_path)
+    # page-parallel for long documents, stops once enough text is collected
+    return pdf_text(source)
 
-def extract_text_from_docx(docx_path: str) -> str:
+def extract_text_from_docx(source: Source) -> str:
     if not _HAS_PYDOCX:
         raise RuntimeError("python-docx is not installed. Install with: pip install python-docx")
-    d = docx.Document(docx_path)
+    with open_document(source) as f:
+        d = docx.Document(f)
     return "\n".join(p.text for p in d.paragraphs)
 
-def extract_text(file_path: str) -> str:
-    lower = file_path.lower()
-    if lower.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    elif lower.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif lower.endswith(".txt"):
-        with open(file_path, "rb") as f:
+def extract_text(source: Source, ext: str | None = None) -> str:
+    """Text of a .pdf/.docx/.txt document; `ext` is required unless `source` is a path."""
+    if ext is None:
+        if not isinstance(source, (str, os.PathLike)):
+            raise ValueError("extract_text needs `ext` when given bytes or a file object")
+        ext = os.path.splitext(os.fspath(source))[1]
+    lower = ext.lower()
+    if lower == ".pdf":
+        return extract_text_from_pdf(source)
+    elif lower == ".docx":
+        return extract_text_from_docx(source)
+    elif lower == ".txt":
+        with open_document(source) as f:
             return f.read().decode("utf-8", errors="ignore")
     else:
-        raise ValueError(f"Unsupported file format: {file_path}")
+        raise ValueError(f"Unsupported file format: {source if isinstance(source, (str, os.PathLike)) else ext}")
 
 # ---------- Personal info extraction ----------
 EMAIL_RE = re.compile(r"[a-z0-9\.\-+_]+@[a-z0-9\.\-+_]+\.[a-z]+", re.I)
@@ -119,59 +160,154 @@ class CVData(BaseModel):
     projects: List[Dict[str, str]] = Field(default=[], description="Notable projects")
     languages: List[str] = Field(default=[], description="Programming/spoken languages")
 
+# ---------- Parse stages ----------
+# Bump a stage's version whenever its extractor changes; the parse cache then
+# re-runs that stage and the stages that consume it, and nothing else.
+STAGE_VERSIONS = {
+    "text": 3,
+    "clean_text": 1,
+    "personal_info": 1,
+    "skills": 1,
+    "experience": 1,
+    "education": 1,
+    "summary": 1,
+    "projects": 1,
+    "languages": 1,
+    "personality_traits": 1,
+}
+STAGE_DEPS = {
+    "clean_text": ["text"],
+    "personal_info": ["clean_text"],
+    "skills": ["clean_text"],
+    "experience": ["clean_text"],
+    "education": ["clean_text"],
+    "summary": ["clean_text", "personal_info", "skills", "experience", "education"],
+    "projects": ["clean_text"],
+    "languages": ["clean_text"],
+    "personality_traits": ["clean_text"],
+}
+STAGE_EFFECTIVE_VERSIONS = effective_versions(STAGE_VERSIONS, STAGE_DEPS)
+# model settings that change what the model-bound stages produce (part of their cache variant)
+MODEL_SETTINGS = f"{model_registry.MODEL_QUANTIZE or 'fp32'},{model_registry.NLI_BACKEND}"
+
 class AIExtractor:
     """
-    Lazy-load transformers pipelines inside the constructor and continue working
-    with heuristic extractors if transformers or torchvision are unavailable.
+    Resolve the transformers pipelines lazily, on first use inside a stage that
+    needs them (so a fully cached parse never loads a model), and continue working
+    with heuristic extractors if they are unavailable.
     """
-    def __init__(self):
+    def __init__(self, use_models: bool = True):
         self.device = 0 if torch.cuda.is_available() else -1
         logger.info(f"Using device: {'GPU' if self.device == 0 else 'CPU'}")
-        self.extractor = None
+        self.use_models = use_models
         self.generator = None
-        self.summerizer = None
-
-        self.extractor = extractor
-        self.summerizer = summarizerPipeline
+        self._models: Dict[str, Any] = {}
+        self._section_indexes: Dict[str, SectionIndex] = {}
 
-    def extract_with_ai_prompting(self, cv_text: str) -> Dict[str, any]:
-        """Use AI prompting to extract structured data from CV text"""
-        clean_text = self._clean_text(cv_text)
+    def _enabled(self, role: str) -> bool:
+        """Whether stages should use `role` (models requested and not known to have failed), without loading it."""
+        return self.use_models and not model_registry.failed(role)
 
-        personal_info = self._extract_personal_info(clean_text)
-        skills = self._extract_skills(clean_text)
-        experience = self._extract_experience(clean_text)
-        education = self._extract_education(clean_text)
-
-        summary = self._generate_professional_candidate_summary(
-        personal_info, skills, experience, education, clean_text
-    )
-
-        return {
-        "personal_info": personal_info,
-        "skills": skills,
-        "experience": experience,
-        "education": education, 
-        "summary": summary,
-        "projects": self._extract_projects(clean_text),
-        "languages": self._extract_languages(clean_text),
-        "personality_traits": self._extract_personality_traits(clean_text)
-    } 
+    def _model(self, role: str):
+        if not self.use_models:
+            return None
+        if self._models.get(role) is None:
+            self._models[role] = model_registry.get(role)
+        if self._models[role] is None:
+            mark_degraded()  # failed to load: the calling stage falls back to its heuristic
+        return self._models[role]
+
+    @property
+    def extractor(self):
+        return self._model("extractor")
+
+    @property
+    def summerizer(self):
+        return self._model("summarizer")
+
+    def extract_with_ai_prompting(self, cv_text: str, memo: Optional[StageMemo] = None) -> Dict[str, any]:
+        """Use AI prompting to extract structured data from CV text.
+        With a `memo`, every stage is served from / recorded into the parse cache."""
+        return dict(self.iter_stages(cv_text, memo))
+
+    def iter_stages(self, cv_text: str, memo: Optional[StageMemo] = None,
+                    timings: Optional[Dict[str, float]] = None, clean_text: Optional[str] = None):
+        """Yield (stage, value) as each stage finishes. Independent stages run
+        concurrently (see stage_dag): regex-only ones on the CPU pool, the ones
+        that call a model on the shared model pool, so the regex-based fields
+        come first. Per-stage wall times (ms) are written to `timings` when given;
+        `clean_text` is the already-cleaned text when the doc store has it."""
+        memo = memo or StageMemo(None, STAGE_EFFECTIVE_VERSIONS)
+        # model-bound stages are cached separately for "model present" and heuristic-only runs;
+        # the keys come from the settings, so cache hits never load a model
+        use_gen, use_summ = self._enabled("extractor"), self._enabled("summarizer")
+        gen = f"ai[{MODEL_SETTINGS}]" if use_gen else "heuristic"
+        summ = f"ai[{MODEL_SETTINGS}]" if use_summ else "heuristic"
+        gen_pool = "model" if use_gen else "cpu"
+        with token_cache.scope():
+            t0 = time.perf_counter()
+            if clean_text is None:
+                clean_text = memo.run("clean_text", lambda: self._clean_text(cv_text))
+            if timings is not None:
+                timings["clean_text"] = round((time.perf_counter() - t0) * 1000, 1)
+
+            def stage(name, fn, variant="", pool="cpu", deps=None):
+                return stage_dag.Stage(name, lambda r: memo.run(name, lambda: fn(r), variant),
+                                       tuple(deps or STAGE_DEPS[name]), pool)
+
+            stages = [
+                stage("personal_info", lambda r: self._extract_personal_info(clean_text)),
+                stage("education", lambda r: self._extract_education(clean_text)),
+                stage("projects", lambda r: self._extract_projects(clean_text)),
+                stage("languages", lambda r: self._extract_languages(clean_text)),
+                stage("skills", lambda r: self._extract_skills(clean_text), f"{gen}-{summ}",
+                      "model" if use_gen or use_summ else "cpu"),
+                stage("experience", lambda r: self._extract_experience(clean_text), gen, gen_pool),
+                stage("personality_traits", lambda r: self._extract_personality_traits(clean_text), gen, gen_pool),
+                # the summarizer only reads the text, so it starts right away; the
+                # heuristic fallback in "summary" reads the other stages' output
+                stage_dag.Stage("summary_model",
+                                lambda r: "" if memo.cached("summary", summ) else (self._model_summary(clean_text) or ""),
+                                ("clean_text",), "model" if use_summ else "cpu"),
+                stage("summary", lambda r: self._summary_stage(r, clean_text, use_summ),
+                      summ, deps=STAGE_DEPS["summary"] + ["summary_model"]),
+            ]
+            for name, value, seconds in stage_dag.run(stages, {"clean_text": clean_text}):
+                if timings is not None:
+                    timings[name] = round(seconds * 1000, 1)
+                if name != "summary_model":
+                    yield name, value
+
+    def _summary_stage(self, r: Dict, clean_text: str, use_summ: bool) -> str:
+        if use_summ and not r["summary_model"]:
+            mark_degraded()  # the summarizer failed in its own stage: the fallback is not memoized
+        return self._generate_professional_candidate_summary(
+            r["personal_info"], r["skills"], r["experience"], r["education"], clean_text,
+            generated=r["summary_model"])
+
+    def _model_summary(self, text: str) -> Optional[str]:
+        """Summarizer output for `text`; None without a summarizer or when it fails."""
+        if not self.summerizer:
+            return None
+        try:
+            summary = run_generation(self.summerizer, text, 2000,
+                                     max_length=150, min_length=40, do_sample=False).strip()
+            if not summary.endswith('.'):
+                summary += '.'
+            return summary
+        except Exception as e:
+            logger.warning(f"Summarization failed: {e}")
+            return None
 
     def _generate_professional_candidate_summary(self, personal_info: Dict, skills: List, 
-                                           experience: List, education: List, text: str) -> str:
-        """Generate a fluid sentence describing the CV and the person using AI summarization."""
-    
-        if self.summerizer:
-            try:
-                clean_text = text[:2000] if len(text) > 2000 else text
-                result = self.summerizer(clean_text, max_length=150, min_length=40, do_sample=False)
-                summary = result[0]['summary_text'].strip()
-                if not summary.endswith('.'):
-                    summary += '.'
-                return summary
-            except Exception as e:
-                logger.warning(f"Summarization failed: {e}")
+                                           experience: List, education: List, text: str,
+                                           generated: Optional[str] = None) -> str:
+        """Generate a fluid sentence describing the CV and the person using AI summarization.
+        `generated` is a summarizer result computed ahead of time ("" if it failed)."""
+        if generated is None:
+            generated = self._model_summary(text)
+        if generated:
+            return generated
 
         name = personal_info.get('name', 'The candidate')
         if name and name != 'Name not found' or name == 'Phone Number':
@@ -710,9 +846,7 @@ class AIExtractor:
 
     def _clean_text(self,text:str) ->str:
         """Clean and normalize CV text"""
-        text = re.sub(r'\n\s*\n', '\n\n',text)
-        text = re.sub(r'[ \t]+', ' ', text)
-        return text
+        return doc_store.clean_text(text)
 
     def _extract_personal_info(self, text: str) -> Dict[str, str]:
         """Extract personal information with improved name detection"""
@@ -803,9 +937,8 @@ class AIExtractor:
         try:
             if self.extractor:
                 # Use a very simple, direct prompt
-                prompt = f"Skills: {text[:800]}"
-                result = self.extractor(prompt, max_length=80, min_length=5, num_return_sequences=1, do_sample=False)
-                response = result[0]['generated_text'].strip()
+                response = run_generation(self.extractor, text, 800, prefix="Skills:",
+                                          max_length=80, min_length=5, num_return_sequences=1, do_sample=False).strip()
                 return response
             else:
                 logger.warning("AI extractor not available, falling back to heuristic method")
@@ -840,13 +973,13 @@ class AIExtractor:
         experience_section = experience_section[:1000]  # Limit section size
         
         # Use a more specific prompt to get actual work experience
-        prompt = f"Extract only professional work experience (jobs, internships, employment) from: {experience_section}"
+        prompt = "Extract only professional work experience (jobs, internships, employment) from:"
         
         try:
             if self.extractor:
                 logger.info(f"Using prompt: {prompt[:100]}...")
-                result = self.extractor(prompt, max_length=200, min_length=20, num_return_sequences=1, do_sample=False)
-                experience = result[0]['generated_text'].strip()
+                experience = run_generation(self.extractor, experience_section, prefix=prompt,
+                                            max_length=200, min_length=20, num_return_sequences=1, do_sample=False).strip()
                 logger.info(f"Raw AI experience response: {experience}")
                 
                 # Filter out responses that are just instruction echoes or completely unrelated
@@ -907,7 +1040,7 @@ class AIExtractor:
                 logger.info("Attempting AI project extraction...")
                 
                 # Create a focused prompt for project extraction
-                prompt = f"""Find and list specific projects from this CV. Look for:
+                prompt = """Find and list specific projects from this CV. Look for:
 - Database migration or upgrade projects
 - System implementations  
 - Technical installations or configurations
@@ -922,16 +1055,15 @@ For each project found, include:
 
 Format as separate bullet points, one project per line.
 
-CV Text: {text[:2000]}
-
-List of specific projects:
-•"""
+CV Text:"""
                 
-                result = self.extractor(prompt, max_length=300, min_length=20, num_return_sequences=1, do_sample=False)
+                projects = run_generation(self.extractor, text, 2000, prefix=prompt,
+                                          suffix="\n\nList of specific projects:\n•",
+                                          max_length=300, min_length=20, num_return_sequences=1, do_sample=False)
                 
                 # Safe access to result
-                if result and len(result) > 0 and 'generated_text' in result[0]:
-                    projects = result[0]['generated_text'].strip()
+                if projects:
+                    projects = projects.strip()
                     logger.info(f"Raw AI projects response: {projects[:200]}...")
                     return projects
                 else:
@@ -962,7 +1094,7 @@ List of specific projects:
                 logger.info("Using AI for personality traits extraction")
                 
                 # More specific AI prompt that asks for diverse, specific traits
-                traits_prompt = f"""Analyze this CV and identify 2-4 specific personality traits that make this person unique based on their actual experiences and roles.
+                traits_prompt = """Analyze this CV and identify 2-4 specific personality traits that make this person unique based on their actual experiences and roles.
 
 Look for evidence of:
 - Specific leadership experiences (not just any teamwork)
@@ -977,12 +1109,11 @@ Look for evidence of:
 Return ONLY 2-4 personality traits separated by commas. Be specific and avoid generic traits.
 Examples: "Creative", "Data-driven", "Technical leadership", "Customer-focused", "Detail-oriented", "Innovative", "Mentoring", "Strategic thinking"
 
-CV Text: {text[:2000]}
-
-Specific personality traits:"""
+CV Text:"""
                 
-                result = self.extractor(traits_prompt, max_length=80, num_return_sequences=1, do_sample=True, temperature=0.7)
-                ai_response = result[0]['generated_text'].strip()
+                ai_response = run_generation(self.extractor, text, 2000, prefix=traits_prompt,
+                                             suffix="\n\nSpecific personality traits:",
+                                             max_length=80, num_return_sequences=1, do_sample=True, temperature=0.7).strip()
                 logger.info(f"AI traits response: {ai_response}")
                 
                 # Parse AI response
@@ -1274,7 +1405,7 @@ Specific personality traits:"""
                 logger.info("Using self.extractor for AI skill extraction")
                 
                 # Create a focused prompt for skill extraction
-                skills_prompt = f"""Extract technical and professional skills from this CV. Return only a comma-separated list of skills.
+                skills_prompt = """Extract technical and professional skills from this CV. Return only a comma-separated list of skills.
 
 Examples of skills to find:
 - Programming languages (Python, Java, JavaScript, etc.)
@@ -1283,13 +1414,12 @@ Examples of skills to find:
 - Tools (Git, Docker, AWS, etc.)
 - Soft skills (Leadership, Communication, etc.)
 
-CV Text: {cv_text[:1500]}
-
-Skills (comma-separated list):"""
+CV Text:"""
 
                 try:
-                    result = self.extractor(skills_prompt, max_length=100, min_length=10, num_return_sequences=1, do_sample=False)
-                    ai_response = result[0]['generated_text'].strip()
+                    ai_response = run_generation(self.extractor, cv_text, 1500, prefix=skills_prompt,
+                                                 suffix="\n\nSkills (comma-separated list):",
+                                                 max_length=100, min_length=10, num_return_sequences=1, do_sample=False).strip()
                     logger.info(f"AI skills response: {ai_response}")
                     
                     # Parse the comma-separated response
@@ -1322,15 +1452,13 @@ Skills (comma-separated list):"""
                     logger.warning(f"Extractor failed: {e}")
             
             # Fallback to summarizer if available
-            if summarizerPipeline:
-                logger.info("Using summarizerPipeline for skill extraction")
+            if self.summerizer:
+                logger.info("Using summarizer pipeline for skill extraction")
                 
                 # Find skills section first
                 skills_section = self._find_section(cv_text, ['skills', 'technical skills', 'competencies', 'strengths'])
-                if skills_section:
-                    text_to_analyze = skills_section[:1000]
-                else:
-                    text_to_analyze = cv_text[:1000]
+                source_text = skills_section if skills_section else cv_text
+                text_to_analyze = source_text[:1000]
                 
                 # Use summarizer to identify key skills
                 try:
@@ -1340,8 +1468,8 @@ Skills (comma-separated list):"""
                     max_len = max(min(input_length - 5, 50), 10)  # Max 50, min 10, leave 5 words buffer
                     min_len = max(min(input_length // 3, max_len - 10), 5)  # Reasonable min length
                     
-                    summary = summarizerPipeline(input_text, max_length=max_len, min_length=min_len, do_sample=False)
-                    summary_text = summary[0]['summary_text']
+                    summary_text = run_generation(self.summerizer, source_text, 1000, prefix="Skills and technologies:",
+                                                  max_length=max_len, min_length=min_len, do_sample=False)
                     logger.info(f"Summarizer output for skills: {summary_text}")
                     
                     # Extract skills from summary using regex
@@ -1642,50 +1770,64 @@ Skills (comma-separated list):"""
 
     def _find_section(self, text:str, keywords:List[str]) -> str:
         """Find and extract a specific section from CV text"""
-        lines = text.split('\n')
-        start_section = -1
+        return self._section_index(text).find(keywords)
 
-        for i, line in enumerate(lines):
-            line_lower = line.strip().lower()
-            if any(kw in line_lower for kw in keywords) and len(line.strip()) <100:
-                start_section = i
-                break
-
-        if start_section == -1:
-            return ""
-        
-        common_headers = ['experience', 'education', 'skills', 'projects', 'contact', 
-                             'summary', 'objective', 'certifications', 'languages', 'references']
-        section_end = len(lines)
-
-        for i in range(start_section + 1, len(lines)):
-            line_lower = lines[i].strip().lower()
-            if any(header in line_lower for header in common_headers) and len(lines[i].strip()) <100:
-                section_end = i
-                break
-
-        return "\n".join(lines[start_section + 1:section_end]) if start_section != -1 else ""
+    def _section_index(self, text: str) -> SectionIndex:
+        """One SectionIndex per text, built on first lookup (or seeded from the doc store)."""
+        index = self._section_indexes.get(text)
+        if index is None:
+            index = self._section_indexes.setdefault(text, SectionIndex(text))
+        return index
 
 # def extract_personal_info(text: str):
 
 # def extract_sections(text: str) -> Dict[str, str]:
 
-def parse_resume_from_bytes(file_bytes: bytes, filename: str):
-    ext = os.path.splitext(filename or "upload.bin")[1].lower()
-    if ext not in (".pdf", ".docx", ".txt"):
-        original = file_bytes.decode("utf-8", errors="ignore")
-    else:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(file_bytes)
-            tmp.close()
-            original = extract_text(tmp.name)
-        try: os.unlink(tmp.name)
-        except: pass
-
-    extractor = AIExtractor()
-    ai_result = extractor.extract_with_ai_prompting(original)
+def parse_resume_from_bytes(file_bytes: bytes | None, filename: str, mode: str = "auto",
+                            timings: Optional[Dict[str, float]] = None, doc: Optional[Dict] = None):
+    for stage, value in parse_resume_stream(file_bytes, filename, mode, timings, doc):
+        if stage == "result":
+            return value
 
-    return {
+def parse_resume_stream(file_bytes: bytes | None, filename: str, mode: str = "auto",
+                        timings: Optional[Dict[str, float]] = None, doc: Optional[Dict] = None):
+    """
+    Yield (stage, value) for every parse stage as soon as it is ready (see
+    AIExtractor.iter_stages), then ("result", <parse_resume_from_bytes output>).
+    `doc` is a doc_store artifact to parse instead of `file_bytes`.
+    Wall time per stage and "total" (ms) are written to `timings` when given.
+    """
+    if mode not in PARSE_MODES:
+        raise ValueError(f"Unknown parse mode '{mode}'. Use one of: {', '.join(PARSE_MODES)}.")
+
+    # Text comes from the doc store shared with /upload_cv (extracted once per
+    # document); the per-stage cache is keyed by the same content hash, so an
+    # unchanged CV is served without extraction or any model call
+    start = time.perf_counter()
+    if doc is None:
+        doc = doc_store.get_or_put(file_bytes, filename)
+    memo = open_memo(doc["doc_id"], STAGE_EFFECTIVE_VERSIONS)
+    if timings is not None:
+        timings["text"] = round((time.perf_counter() - start) * 1000, 1)
+
+    extractor = AIExtractor(use_models=(mode == "auto"))
+    if doc.get("section_index_version") == SECTION_INDEX_VERSION:
+        # section lookups on the cleaned text reuse the offsets stored with it
+        extractor._section_indexes[doc["clean_text"]] = SectionIndex.from_dict(doc["clean_text"], doc["sections"])
+    ai_result = {}
+    try:
+        for stage, value in extractor.iter_stages(doc["raw_text"], memo, timings, doc["clean_text"]):
+            ai_result[stage] = value
+            yield stage, value
+    finally:
+        # stages finished before a client disconnect are kept too
+        memo.save()
+    if memo.hits:
+        logger.info(f"Parse cache: reused {memo.hits}, computed {memo.misses}")
+    if timings is not None:
+        timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+
+    yield "result", {
         "personal_info": ai_result["personal_info"],
         "sections": {
             "experience": str(ai_result.get("experience", [])),
@@ -1698,4 +1840,4 @@ def parse_resume_from_bytes(file_bytes: bytes, filename: str):
         "certifications": ai_result.get("certifications", []),
         "languages": ai_result.get("languages", []),
         "projects": ai_result.get("projects", []) if ai_result.get("projects") else []  # Return projects as list, not string
-    }
\ No newline at end of file
+    }
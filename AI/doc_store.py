@@ -0,0 +1,167 @@
+# Extracted-text artifacts shared by /upload_cv and /parse_resume.
+# A document is keyed by the SHA-256 of its bytes (its doc_id). The first
+# endpoint to see it extracts it once (extractors.extract) and stores the raw
+# text, the cleaned text, the char offsets of its sections (sections.SectionIndex)
+# and of its pages, plus how it was extracted. Either endpoint can then be called with
+# the doc_id instead of the file. Artifacts are JSON files in DOC_STORE_DIR
+# (so every gunicorn worker sees them) behind a small in-process LRU, and
+# expire DOC_STORE_TTL_SEC after they were last stored.
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import extractors
+from sections import INDEX_VERSION as SECTION_INDEX_VERSION, SectionIndex
+
+logger = logging.getLogger("doc_store")
+
+DOC_STORE_DIR = os.environ.get("DOC_STORE_DIR", os.path.join(".cache", "docs"))  # "" = this process only
+DOC_STORE_TTL_SEC = float(os.environ.get("DOC_STORE_TTL_SEC", "3600"))
+DOC_STORE_MEMORY_ITEMS = int(os.environ.get("DOC_STORE_MEMORY_ITEMS", "64"))
+
+_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_lock = threading.Lock()
+_memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_last_prune = 0.0
+_stats = {"hits": 0, "misses": 0, "expired": 0}
+
+
+def doc_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def clean_text(text: str) -> str:
+    """Collapse blank-line runs and horizontal whitespace (the parser's input)."""
+    text = re.sub(r'\n\s*\n', '\n\n', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    return text
+
+
+def page_map(text: str) -> List[List[int]]:
+    """[start, end) char offsets of each page; PDF extractors end every page with a form feed."""
+    pages, start = [], 0
+    for m in re.finditer("\f", text):
+        pages.append([start, m.end()])
+        start = m.end()
+    if start < len(text) and text[start:].strip():
+        pages.append([start, len(text)])
+    return pages
+
+
+def _path(key: str) -> str:
+    return os.path.join(DOC_STORE_DIR, f"{key}.json")
+
+
+def _remember(doc: Dict[str, Any]) -> None:
+    with _lock:
+        _memory[doc["doc_id"]] = doc
+        _memory.move_to_end(doc["doc_id"])
+        while len(_memory) > max(0, DOC_STORE_MEMORY_ITEMS):
+            _memory.popitem(last=False)
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    """Stored artifact for a doc_id, or None if unknown, malformed or expired."""
+    if not _ID_RE.match(key or ""):
+        return None
+    now = time.time()
+    with _lock:
+        doc = _memory.get(key)
+    if doc is None and DOC_STORE_DIR:
+        try:
+            with open(_path(key), "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            doc = None
+    if doc is not None and now - doc.get("stored", 0) > DOC_STORE_TTL_SEC:
+        _count("expired")
+        _forget(key)
+        doc = None
+    if doc is None:
+        _count("misses")
+        return None
+    _count("hits")
+    _remember(doc)
+    return doc
+
+
+def _forget(key: str) -> None:
+    with _lock:
+        _memory.pop(key, None)
+    if DOC_STORE_DIR:
+        try:
+            os.remove(_path(key))
+        except OSError:
+            pass
+
+
+def put(data: bytes, filename: str | None = None) -> Dict[str, Any]:
+    """Extract `data` (see extractors.extract) and store the artifact; raises ExtractionError."""
+    raw, extraction = extractors.extract(data)
+    clean = clean_text(raw)
+    doc = {
+        "doc_id": doc_id(data),
+        "filename": filename,
+        "stored": time.time(),
+        "extractor_version": extractors.EXTRACTOR_VERSION,
+        "extraction": extraction,
+        "raw_text": raw,
+        "clean_text": clean,
+        "pages": page_map(raw),
+        "section_index_version": SECTION_INDEX_VERSION,
+        "sections": SectionIndex(clean).to_dict(),
+    }
+    _remember(doc)
+    if DOC_STORE_DIR:
+        try:
+            os.makedirs(DOC_STORE_DIR, exist_ok=True)
+            tmp = f"{_path(doc['doc_id'])}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(doc, f, ensure_ascii=False)
+            os.replace(tmp, _path(doc["doc_id"]))
+        except OSError as e:
+            logger.warning("Could not write doc store entry %s: %s", doc["doc_id"], e)
+    _prune()
+    return doc
+
+
+def get_or_put(data: bytes, filename: str | None = None) -> Dict[str, Any]:
+    """Artifact for these bytes, extracting them only if not stored (or stored by an older extractor or index)."""
+    doc = get(doc_id(data))
+    if (doc is not None and doc.get("extractor_version") == extractors.EXTRACTOR_VERSION
+            and doc.get("section_index_version") == SECTION_INDEX_VERSION):
+        return doc
+    return put(data, filename)
+
+
+def _prune() -> None:
+    """Drop expired files (checked at most once a minute)."""
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 60 or not DOC_STORE_DIR or not os.path.isdir(DOC_STORE_DIR):
+        return
+    _last_prune = now
+    for name in os.listdir(DOC_STORE_DIR):
+        path = os.path.join(DOC_STORE_DIR, name)
+        try:
+            if name.endswith(".json") and now - os.path.getmtime(path) > DOC_STORE_TTL_SEC:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, "in_memory": len(_memory), "ttl_sec": DOC_STORE_TTL_SEC, "dir": DOC_STORE_DIR or None}
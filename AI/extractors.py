@@ -0,0 +1,408 @@
+# Document text extraction for uploads.
+# The format is detected from the file's magic bytes (never its name) and the
+# document goes through that format's registered extractors in priority order
+# until one returns text: for PDFs the poppler `pdftotext` text-layer reader
+# (fast path, installed in the Docker image) and then pdfminer, for DOCX
+# python-docx, for plain text a BOM-aware decode. Every file gets
+# EXTRACT_TIME_BUDGET_SEC across all attempts and at most EXTRACT_MAX_PAGES
+# pages; the caller gets the text plus which extractor produced it, the page
+# count, whether it was truncated and the time spent in each extractor.
+#
+# open_document() is the in-memory stream layer shared with cv_parser.
+import io
+import os
+import mmap
+import time
+import shutil
+import zipfile
+import logging
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, List, Tuple, Union
+
+logger = logging.getLogger("extractors")
+
+EXTRACT_TIME_BUDGET_SEC = float(os.environ.get("EXTRACT_TIME_BUDGET_SEC", "10"))
+EXTRACT_MAX_PAGES = int(os.environ.get("EXTRACT_MAX_PAGES", "30"))
+EXTRACT_MMAP_MIN_MB = float(os.environ.get("EXTRACT_MMAP_MIN_MB", "16"))
+PDFTOTEXT_BIN = os.environ.get("PDFTOTEXT_BIN", "pdftotext")
+# bump when extraction output changes, so cached results built on the old text are not reused
+EXTRACTOR_VERSION = 3
+
+Source = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+
+class ExtractionError(ValueError):
+    """The upload is not a supported document or no extractor could read any text from it."""
+
+
+# ---------- In-memory document streams ----------
+# Uploads are read straight from memory (io.BytesIO shares the bytes, no copy)
+# instead of a temp file on disk. Sources of EXTRACT_MMAP_MIN_MB or more are
+# memory-mapped rather than read into memory: files as they are, unseekable
+# streams after spilling to an anonymous (already unlinked) temp file.
+class _MmapReader(io.RawIOBase):
+    """Read-only file object over a memory map (pdfminer only accepts io.IOBase)."""
+
+    def __init__(self, fileno: int):
+        self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._map.read(None if size is None or size < 0 else size)
+
+    def readinto(self, buffer) -> int:
+        data = self._map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self) -> int:
+        return self._map.tell()
+
+    def close(self) -> None:
+        if not self.closed:
+            self._map.close()
+        super().close()
+
+
+def _mmap_file(f) -> BinaryIO:
+    if not os.fstat(f.fileno()).st_size:
+        return io.BytesIO(b"")  # empty files cannot be mapped
+    return _MmapReader(f.fileno())
+
+
+def _is_large(size: int) -> bool:
+    return size >= EXTRACT_MMAP_MIN_MB * 1024 * 1024
+
+
+@contextmanager
+def open_document(source: Source):
+    """Seekable binary stream over `source` for pdfminer/python-docx, closed (and
+    any spill file removed) on exit."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            if _is_large(os.fstat(f.fileno()).st_size):
+                with _mmap_file(f) as m:
+                    yield m
+            else:
+                yield f
+        return
+    # file-like: use it in place when it is a large real file or already seekable
+    try:
+        fileno = source.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is not None and _is_large(os.fstat(fileno).st_size):
+        with _mmap_file(source) as m:
+            yield m
+        return
+    if getattr(source, "seekable", lambda: False)():
+        source.seek(0)
+        yield source
+        return
+    data = source.read(int(EXTRACT_MMAP_MIN_MB * 1024 * 1024))
+    extra = source.read(1)
+    if not extra:
+        yield io.BytesIO(data)
+        return
+    with tempfile.TemporaryFile() as spill:
+        spill.write(data)
+        spill.write(extra)
+        shutil.copyfileobj(source, spill)
+        spill.flush()
+        with _mmap_file(spill) as m:
+            yield m
+
+
+# ---------- Format detection ----------
+def detect_format(data: bytes) -> str:
+    """"pdf", "docx", "txt", or the kind of unsupported file ("doc", "zip", "binary")."""
+    head = bytes(data[:1024])
+    if b"%PDF-" in head:  # the spec tolerates leading junk before the header
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as z:
+                return "docx" if "word/document.xml" in z.namelist() else "zip"
+        except zipfile.BadZipFile:
+            return "binary"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "doc"  # legacy OLE Word file
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "txt"  # UTF-16 BOM
+    sample = bytes(data[:4096])
+    if b"\0" in sample:
+        return "binary"
+    return "txt"
+
+
+# ---------- Registry ----------
+# extractor(data, max_pages, deadline) -> (text, pages or None, truncated)
+Extractor = Callable[[bytes, int, float], Tuple[str, Any, bool]]
+_REGISTRY: Dict[str, List[Tuple[int, str, Extractor]]] = {}
+
+
+def register(fmt: str, name: str, fn: Extractor, priority: int = 100) -> None:
+    """Add an extractor for `fmt`; lower priority runs first."""
+    chain = [e for e in _REGISTRY.get(fmt, []) if e[1] != name]
+    chain.append((priority, name, fn))
+    chain.sort(key=lambda e: e[0])
+    _REGISTRY[fmt] = chain
+
+
+def registered() -> Dict[str, List[str]]:
+    return {fmt: [name for _, name, _ in chain] for fmt, chain in _REGISTRY.items()}
+
+
+def _pdftotext(data: bytes, max_pages: int, deadline: float) -> Tuple[str, Any, bool]:
+    if not shutil.which(PDFTOTEXT_BIN):
+        raise RuntimeError(f"{PDFTOTEXT_BIN} not installed")
+    # one page more than the cap tells whether the document was cut
+    cmd = [PDFTOTEXT_BIN, "-q", "-enc", "UTF-8", "-l", str(max_pages + 1), "-", "-"]
+    proc = subprocess.run(cmd, input=bytes(data), capture_output=True,
+                          timeout=max(deadline - time.monotonic(), 0.1))
+    if proc.returncode != 0:
+        raise RuntimeError(f"{PDFTOTEXT_BIN} exited with {proc.returncode}")
+    pages = proc.stdout.decode("utf-8", errors="ignore").split("\f")
+    if pages and not pages[-1].strip():
+        pages.pop()  # pdftotext ends every page with a form feed
+    truncated = len(pages) > max_pages
+    pages = pages[:max_pages]
+    # keep the form feeds, like pdfminer: they are the page map
+    return "".join(p + "\f" for p in pages), len(pages), truncated
+
+
+# ---------- Page-parallel PDF engine ----------
+# pdfminer is pure Python and its cost grows with page count. Documents of
+# PDF_PARALLEL_MIN_PAGES or more are split into ranges of PDF_PAGES_PER_TASK
+# pages that run on a pool of PDF_WORKERS processes (forkserver children that
+# only import this module); page texts are reassembled in page order. Reading
+# stops once the pages collected so far (from the start of the document) hold
+# PDF_TEXT_TARGET_CHARS characters, which covers what the classifier windows
+# and the section finder use, or when the time budget runs out (whatever page
+# ranges finished by then are returned, marked truncated).
+# In extract() pdftotext (native, faster per page than this engine) still goes
+# first when it is installed, as in the Docker image; this engine serves PDFs
+# pdftotext fails on or where it is missing, and cv_parser.extract_text_from_pdf.
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "2"))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "4"))
+PDF_TEXT_TARGET_CHARS = int(os.environ.get("PDF_TEXT_TARGET_CHARS", "30000"))  # 0 = no early stop
+
+_pdf_pool = None
+_pdf_pool_pid = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _pdf_process_pool() -> ProcessPoolExecutor:
+    # (re)create after fork: pool processes belong to the process that started them
+    global _pdf_pool, _pdf_pool_pid
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_pid != os.getpid():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(["extractors"])
+            _pdf_pool = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS), mp_context=ctx)
+            _pdf_pool_pid = os.getpid()
+        return _pdf_pool
+
+
+def _reset_pdf_process_pool() -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        _pdf_pool = None
+
+
+def pdf_page_count(source: Source) -> int:
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+
+    with open_document(source) as fp:
+        doc = PDFDocument(PDFParser(fp))
+        pages = resolve1(doc.catalog.get("Pages"))
+        count = resolve1(pages.get("Count")) if isinstance(pages, dict) else None
+        if isinstance(count, int) and count > 0:
+            return count
+        return sum(1 for _ in PDFPage.create_pages(doc))
+
+
+def _pdf_page_texts(source: Source, start: int, stop: int, deadline: float | None = None,
+                    target_chars: int = 0) -> List[str]:
+    """Text of pages [start, stop) in order, each as pdfminer.high_level.extract_text
+    renders it (ending in a form feed). Stops after a page once `deadline` has
+    passed or `target_chars` have been collected."""
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    out = io.StringIO()
+    texts: List[str] = []
+    with open_document(source) as fp:
+        rsrcmgr = PDFResourceManager(caching=True)
+        device = TextConverter(rsrcmgr, out, codec="utf-8", laparams=LAParams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        pagenos = set(range(start, stop))
+        for page in PDFPage.get_pages(fp, pagenos=pagenos, maxpages=stop, caching=True):
+            mark = out.tell()
+            interpreter.process_page(page)
+            texts.append(out.getvalue()[mark:])
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            if target_chars and sum(len(t) for t in texts) >= target_chars:
+                break
+        device.close()
+    return texts
+
+
+def pdf_pages(source: Source, max_pages: int | None = None, deadline: float | None = None,
+              target_chars: int | None = None) -> Tuple[List[str], int, bool]:
+    """
+    Page texts of a PDF in page order, at most `max_pages`, stopping early at
+    `target_chars` (default PDF_TEXT_TARGET_CHARS) or `deadline` (time.monotonic()).
+    Returns (page texts, total pages in the document, truncated).
+    """
+    cap = max(1, EXTRACT_MAX_PAGES if max_pages is None else max_pages)
+    target = PDF_TEXT_TARGET_CHARS if target_chars is None else target_chars
+    total = pdf_page_count(source)
+    wanted = min(total, cap)
+
+    if PDF_WORKERS <= 1 or wanted < max(PDF_PARALLEL_MIN_PAGES, 2):
+        texts = _pdf_page_texts(source, 0, wanted, deadline, target)
+        return texts, total, len(texts) < total
+
+    # workers get the path, or the bytes once, rather than an open stream
+    if not isinstance(source, (str, os.PathLike, bytes)):
+        with open_document(source) as f:
+            source = f.read()
+    step = max(1, PDF_PAGES_PER_TASK)
+    ranges = [(s, min(s + step, wanted)) for s in range(0, wanted, step)]
+    try:
+        pool = _pdf_process_pool()
+    except (OSError, ValueError) as e:
+        logger.warning("PDF process pool unavailable, extracting in-process: %s", e)
+        texts = _pdf_page_texts(source, 0, wanted, deadline, target)
+        return texts, total, len(texts) < total
+
+    done: Dict[int, List[str]] = {}
+    pending: Dict[Any, int] = {}
+    prefix, collected, submitted = 0, 0, 0
+    try:
+        while prefix < len(ranges):
+            # keep every worker busy, in page order, without queueing the whole document
+            while submitted < len(ranges) and len(pending) < max(1, PDF_WORKERS) * 2:
+                start, stop = ranges[submitted]
+                pending[pool.submit(_pdf_page_texts, source, start, stop)] = submitted
+                submitted += 1
+            # every range, the first one included, only within the budget: a page that
+            # never finishes must not hold the request past its deadline (the pool
+            # process stays busy with it, but its result is dropped)
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            finished, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not finished:
+                break
+            for fut in finished:
+                done[pending.pop(fut)] = fut.result()
+            while prefix in done:
+                collected += sum(len(t) for t in done[prefix])
+                prefix += 1
+            if target and collected >= target:
+                break
+    except BrokenProcessPool as e:
+        logger.warning("PDF process pool failed, extracting in-process: %s", e)
+        _reset_pdf_process_pool()
+        texts = _pdf_page_texts(source, 0, wanted, deadline, target)
+        return texts, total, len(texts) < total
+    finally:
+        for fut in pending:
+            fut.cancel()
+    texts = [t for i in range(prefix) for t in done[i]]
+    return texts, total, len(texts) < total
+
+
+def pdf_text(source: Source, max_pages: int | None = None, deadline: float | None = None,
+             target_chars: int | None = None) -> str:
+    """pdfminer text of a PDF (see pdf_pages)."""
+    return "".join(pdf_pages(source, max_pages, deadline, target_chars)[0])
+
+
+def _pdfminer(data: bytes, max_pages: int, deadline: float) -> Tuple[str, Any, bool]:
+    texts, _, truncated = pdf_pages(data, max_pages, deadline)
+    if not texts and truncated and time.monotonic() >= deadline:
+        raise RuntimeError("time budget exhausted before the first pages were read")
+    return "".join(texts), len(texts), truncated
+
+
+def _python_docx(data: bytes, max_pages: int, deadline: float) -> Tuple[str, Any, bool]:
+    import docx
+    with open_document(data) as f:
+        d = docx.Document(f)
+    return "\n".join(p.text for p in d.paragraphs), None, False
+
+
+def _plain_text(data: bytes, max_pages: int, deadline: float) -> Tuple[str, Any, bool]:
+    head = bytes(data[:3])
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return bytes(data).decode("utf-16", errors="ignore"), None, False
+    return bytes(data).decode("utf-8-sig" if head == b"\xef\xbb\xbf" else "utf-8", errors="ignore"), None, False
+
+
+register("pdf", "pdftotext", _pdftotext, priority=10)
+register("pdf", "pdfminer", _pdfminer, priority=20)
+register("docx", "python-docx", _python_docx)
+register("txt", "text", _plain_text)
+
+
+def extract(data: bytes, time_budget: float | None = None, max_pages: int | None = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Text of an uploaded document and how it was obtained:
+    {"format", "extractor", "pages", "truncated", "timings_ms": {extractor: ms}, "errors": {extractor: reason}}.
+    Raises ExtractionError for unsupported formats or when no extractor yields any text.
+    """
+    fmt = detect_format(data)
+    if fmt not in _REGISTRY:
+        raise ExtractionError(f"Unsupported document type ({fmt}). Upload a PDF, DOCX or plain-text CV.")
+    budget = EXTRACT_TIME_BUDGET_SEC if time_budget is None else time_budget
+    cap = max(1, EXTRACT_MAX_PAGES if max_pages is None else max_pages)
+    deadline = time.monotonic() + budget
+    info: Dict[str, Any] = {"format": fmt, "extractor": None, "pages": None, "truncated": False,
+                            "timings_ms": {}, "errors": {}}
+    for _, name, fn in _REGISTRY[fmt]:
+        if info["timings_ms"] and time.monotonic() > deadline:
+            info["errors"][name] = "time budget exhausted"
+            break
+        t0 = time.perf_counter()
+        try:
+            text, pages, truncated = fn(data, cap, deadline)
+        except subprocess.TimeoutExpired:
+            text, error = "", f"exceeded the {budget:g}s time budget"
+        except Exception as e:
+            text, error = "", str(e) or type(e).__name__
+        else:
+            error = None if text.strip() else "no text found"
+        info["timings_ms"][name] = round((time.perf_counter() - t0) * 1000, 1)
+        if error is None:
+            info.update(extractor=name, pages=pages, truncated=truncated)
+            return text, info
+        info["errors"][name] = error
+        logger.info("Extractor %s gave no text (%s), trying the next one", name, error)
+    reasons = "; ".join(f"{name}: {error}" for name, error in info["errors"].items())
+    raise ExtractionError(f"No text could be extracted from the {fmt.upper()} file ({reasons}).")
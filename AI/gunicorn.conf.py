@@ -0,0 +1,54 @@
+# Gunicorn settings shared by the Procfile, start.sh and the Dockerfile
+# (command-line flags still override anything set here).
+#
+# MODEL_SHARING=none (default): every worker starts accepting as soon as it
+# forks and loads its models in a background thread, so /health, /ready,
+# /admin/* and heuristic parses are answered while models load (see /ready).
+# Each worker holds its own copy of the weights.
+#
+# MODEL_SHARING=preload: app.py is imported once in the master and the models
+# (bart-large-mnli, bart-large-cnn, spaCy) are loaded there for up to
+# MODEL_STARTUP_BUDGET_SEC before the workers fork. Tensor storage is never
+# written after loading, so the workers share those pages copy-on-write and
+# adding workers adds request-handling capacity without multiplying RSS. The
+# port is bound during the preload but no worker exists yet, so nothing is
+# answered until it finishes; set MODEL_STARTUP_BUDGET_SEC to bound that wait.
+# Anything not loaded within the budget is loaded in the background in each
+# worker.
+import gc
+import os
+
+MODEL_SHARING = os.environ.get("MODEL_SHARING", "none")
+
+preload_app = MODEL_SHARING == "preload"
+
+if preload_app:
+    # Keep the master single-threaded while it loads weights: an OpenMP pool
+    # created before fork is not usable in the children.
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    import torch
+    torch.set_num_threads(1)
+
+
+def when_ready(server):
+    if preload_app:
+        import model_registry
+        import cv_parser  # noqa: F401  (no models at import; keeps the import out of the workers)
+        left = model_registry.preload()
+        if left:
+            server.log.warning("Startup budget spent; workers will load %s in the background", ", ".join(left))
+        # move everything loaded so far out of GC tracking so collections in the
+        # workers don't touch (and un-share) those pages
+        gc.freeze()
+        server.log.info("Models preloaded in master (pid %s); workers will share them", os.getpid())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import torch
+        workers = max(1, int(server.cfg.workers))
+        threads = int(os.environ.get("TORCH_NUM_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers)
+        torch.set_num_threads(threads)
+    # loads in a daemon thread, so this worker accepts requests right away
+    import model_registry
+    model_registry.start_background()
@@ -0,0 +1,224 @@
+# Asynchronous jobs for long-running endpoints (/jobs/upload_cv, /jobs/parse_resume).
+# A request enqueues the uploaded bytes on a bounded in-process queue and gets a
+# job id back immediately; a small pool of threads in the same process runs the
+# registered handler with the already-loaded models. Job state is written to
+# JOBS_DIR as one JSON file per job, so GET /jobs/<id> works from any gunicorn
+# worker, and a finished job optionally POSTs its result to a webhook.
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("jobs")
+
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(".cache", "jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "32"))
+JOB_TTL_SEC = float(os.environ.get("JOB_TTL_SEC", str(24 * 3600)))
+# default callback for every job (e.g. the Java API); per-request callback_url
+# values must start with one of JOB_CALLBACK_PREFIXES (comma-separated)
+JOB_WEBHOOK_URL = os.environ.get("JOB_WEBHOOK_URL", "")
+JOB_CALLBACK_PREFIXES = [p.strip() for p in os.environ.get("JOB_CALLBACK_PREFIXES", "").split(",") if p.strip()]
+JOB_WEBHOOK_TIMEOUT = float(os.environ.get("JOB_WEBHOOK_TIMEOUT", "5"))
+JOB_WEBHOOK_RETRIES = int(os.environ.get("JOB_WEBHOOK_RETRIES", "3"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class QueueFull(Exception):
+    """Raised by submit() when JOB_QUEUE_MAX jobs are already waiting."""
+
+
+def callback_allowed(url: str) -> bool:
+    return any(url.startswith(prefix) for prefix in JOB_CALLBACK_PREFIXES)
+
+
+def _path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _write(state: Dict[str, Any]) -> None:
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    tmp = f"{_path(state['id'])}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, _path(state["id"]))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    """Current state of a job, or None if the id is unknown (or malformed)."""
+    if not _ID_RE.match(job_id or ""):
+        return None
+    try:
+        with open(_path(job_id), "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # the input bytes only live in the owning process's queue: if it died, the job is lost
+    if state["status"] in (QUEUED, RUNNING) and not _pid_alive(state.get("pid", 0)):
+        state.update(status=FAILED, error="worker process exited before the job finished")
+    return state
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX):
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, max_queued))
+        self._handlers: Dict[str, Callable[..., Dict[str, Any]]] = {}
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._stats = {"submitted": 0, "done": 0, "failed": 0, "rejected": 0, "webhooks_failed": 0}
+
+    def register(self, kind: str, handler: Callable[..., Dict[str, Any]]) -> None:
+        """`handler(**args)` returns the job's result payload (the sync endpoint's JSON body)."""
+        self._handlers[kind] = handler
+
+    def _ensure_workers(self) -> None:
+        # (re)start after fork, like the micro-batchers
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+                             for i in range(self.workers)]
+            for t in self._threads:
+                t.start()
+
+    def submit(self, kind: str, args: Dict[str, Any], callback_url: str | None = None,
+               meta: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """Queue a job and return its initial state; raises QueueFull when the queue is at capacity."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self._ensure_workers()
+        self._prune()
+        state = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": QUEUED,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "pid": os.getpid(),
+            "callback_url": callback_url or JOB_WEBHOOK_URL or None,
+            "webhook": None,
+            "meta": meta or {},
+            "result": None,
+            "error": None,
+        }
+        _write(state)
+        try:
+            self._queue.put_nowait((state, args))
+        except queue.Full:
+            os.remove(_path(state["id"]))
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise QueueFull(f"{self._queue.maxsize} jobs already queued")
+        with self._lock:
+            self._stats["submitted"] += 1
+        return state
+
+    def _loop(self) -> None:
+        # the only consumers of the queue: nothing may escape an iteration
+        while True:
+            state, args = self._queue.get()
+            try:
+                self._run(state, args)
+            except Exception as e:
+                # bookkeeping failed (jobs dir unwritable, unserializable result, webhook error)
+                logger.exception("Job %s (%s) could not be completed", state["id"], state["kind"])
+                with self._lock:
+                    if state["finished"] is None:
+                        self._stats["failed"] += 1
+                    elif state["status"] == DONE:
+                        self._stats["done"] -= 1
+                        self._stats["failed"] += 1
+                state.update(status=FAILED, result=None, error=f"{type(e).__name__}: {e}",
+                             finished=state["finished"] or time.time())
+                try:
+                    _write(state)
+                except Exception as write_error:
+                    logger.warning("Could not record failure of job %s: %s", state["id"], write_error)
+
+    def _run(self, state: Dict[str, Any], args: Dict[str, Any]) -> None:
+        state.update(status=RUNNING, started=time.time())
+        _write(state)
+        try:
+            state.update(status=DONE, result=self._handlers[state["kind"]](**args))
+        except Exception as e:
+            logger.warning("Job %s (%s) failed: %s", state["id"], state["kind"], e)
+            state.update(status=FAILED, error=str(e))
+        state["finished"] = time.time()
+        with self._lock:
+            self._stats["done" if state["status"] == DONE else "failed"] += 1
+        _write(state)
+        if state["callback_url"]:
+            state["webhook"] = self._notify(state)
+            _write(state)
+
+    def _notify(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """POST the finished job to its callback URL, retrying with backoff."""
+        body = json.dumps({k: state[k] for k in ("id", "kind", "status", "result", "error", "meta")},
+                          ensure_ascii=False).encode("utf-8")
+        error = None
+        for attempt in range(1, max(1, JOB_WEBHOOK_RETRIES) + 1):
+            req = urllib.request.Request(state["callback_url"], data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(req, timeout=JOB_WEBHOOK_TIMEOUT) as resp:
+                    return {"delivered": True, "http_status": resp.status, "attempts": attempt}
+            except Exception as e:
+                error = str(e)
+                if attempt < JOB_WEBHOOK_RETRIES:
+                    time.sleep(min(2 ** attempt, 10) * 0.5)
+        logger.warning("Webhook for job %s failed: %s", state["id"], error)
+        with self._lock:
+            self._stats["webhooks_failed"] += 1
+        return {"delivered": False, "error": error, "attempts": max(1, JOB_WEBHOOK_RETRIES)}
+
+    def _prune(self) -> None:
+        """Drop finished job files older than JOB_TTL_SEC (checked at most once a minute)."""
+        now = time.time()
+        if now - self._last_prune < 60 or not os.path.isdir(JOBS_DIR):
+            return
+        self._last_prune = now
+        for name in os.listdir(JOBS_DIR):
+            path = os.path.join(JOBS_DIR, name)
+            try:
+                if name.endswith(".json") and now - os.path.getmtime(path) > JOB_TTL_SEC:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "queued": self._queue.qsize(), "max_queued": self._queue.maxsize,
+                    "workers": self.workers}
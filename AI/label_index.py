@@ -0,0 +1,150 @@
+# Precomputed hypothesis tokenizations for the configured category labels.
+# Labels only change when an admin saves categories, so each label's
+# "This example is {label}." hypothesis is tokenized once per tokenizer and
+# reused by every request. BART-MNLI and the MiniLM NLI model are
+# cross-encoders (premise and hypothesis attend to each other), so token ids
+# are the deepest per-label state that can be precomputed for them.
+#
+# The index also keeps a TF-IDF vector per label (character 3-grams inside
+# word boundaries, so "C#", ".NET" and "Spring Boot" all get usable vectors).
+# Cosine similarity against these is the cheap first stage of the two-stage
+# classifier in zero_shot.
+import re
+import math
+import threading
+import logging
+from collections import Counter
+from typing import Dict, List, Iterable, Any
+
+import numpy as np
+
+import token_cache
+
+logger = logging.getLogger("label_index")
+
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    grams: Counter = Counter()
+    for word in re.findall(r"\S+", (text or "").lower()):
+        padded = f" {word} "
+        for i in range(max(len(padded) - n + 1, 1)):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+def _labels_of(categories: Dict[str, List[str]]) -> set:
+    return {lbl for labels in (categories or {}).values() for lbl in (labels or []) if isinstance(lbl, str)}
+
+
+class LabelIndex:
+    def __init__(self, template: str = HYPOTHESIS_TEMPLATE):
+        self.template = template
+        self._lock = threading.Lock()
+        self._labels: set = set()
+        self._tokenizers: Dict[str, Any] = {}
+        self._ids: Dict[str, Dict[str, List[int]]] = {}
+        self._stats = {"hits": 0, "misses": 0, "syncs": 0, "tokenized": 0}
+        # TF-IDF label vectors: rows are L2-normalised, one per label
+        self._vocab: Dict[str, int] = {}
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def _tokenize(self, tokenizer, labels: Iterable[str]) -> Dict[str, List[int]]:
+        out = {lbl: list(tokenizer(self.template.format(lbl), add_special_tokens=False)["input_ids"]) for lbl in labels}
+        self._stats["tokenized"] += len(out)
+        return out
+
+    def register(self, tokenizer) -> None:
+        """Start tracking a tokenizer and tokenize every known label for it."""
+        key = token_cache.tokenizer_key(tokenizer)
+        with self._lock:
+            if key in self._tokenizers:
+                return
+            self._tokenizers[key] = tokenizer
+            self._ids[key] = self._tokenize(tokenizer, self._labels)
+
+    def sync(self, categories: Dict[str, List[str]]) -> None:
+        """Bring the index in line with `categories`, only touching labels that changed."""
+        labels = _labels_of(categories)
+        with self._lock:
+            added, removed = labels - self._labels, self._labels - labels
+            self._labels = labels
+            for key, tokenizer in self._tokenizers.items():
+                ids = self._ids[key]
+                for lbl in removed:
+                    ids.pop(lbl, None)
+                ids.update(self._tokenize(tokenizer, added - ids.keys()))
+            if added or removed:
+                self._rebuild_vectors()
+            self._stats["syncs"] += 1
+        if added or removed:
+            logger.info("Label index synced: +%d -%d labels", len(added), len(removed))
+
+    def hypothesis_ids(self, tokenizer, label: str) -> List[int]:
+        """Token ids (no special tokens) of the hypothesis for `label`."""
+        self.register(tokenizer)
+        key = token_cache.tokenizer_key(tokenizer)
+        with self._lock:
+            ids = self._ids[key].get(label)
+            if ids is not None:
+                self._stats["hits"] += 1
+                return ids
+            # label not configured (yet): tokenize on demand and keep it
+            self._stats["misses"] += 1
+            ids = self._tokenize(tokenizer, [label])[label]
+            self._ids[key][label] = ids
+            return ids
+
+    def _rebuild_vectors(self) -> None:
+        """Recompute the label TF-IDF matrix (IDF is taken over the label set; caller holds the lock)."""
+        labels = sorted(self._labels)
+        grams = [char_ngrams(lbl) for lbl in labels]
+        df: Counter = Counter(g for counts in grams for g in counts)
+        vocab = {g: i for i, g in enumerate(sorted(df))}
+        n = len(labels)
+        idf = np.array([math.log((1 + n) / (1 + df[g])) + 1.0 for g in sorted(df)], dtype=np.float32)
+        matrix = np.zeros((n, len(vocab)), dtype=np.float32)
+        for row, counts in enumerate(grams):
+            for g, c in counts.items():
+                matrix[row, vocab[g]] = c
+        matrix *= idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        self._vocab, self._idf, self._matrix = vocab, idf, matrix
+        self._rows = {lbl: i for i, lbl in enumerate(labels)}
+
+    def _vector(self, text: str, vocab: Dict[str, int], idf: np.ndarray) -> np.ndarray:
+        vec = np.zeros(len(vocab), dtype=np.float32)
+        for g, c in char_ngrams(text).items():
+            i = vocab.get(g)
+            if i is not None:
+                vec[i] = c
+        vec *= idf
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def similarity(self, text: str, labels: List[str]) -> List[float]:
+        """TF-IDF cosine between `text` and each label, using the precomputed label vectors."""
+        with self._lock:
+            vocab, idf, matrix, rows = self._vocab, self._idf, self._matrix, self._rows
+        if not labels:
+            return []
+        doc = self._vector(text, vocab, idf)
+        out = []
+        for lbl in labels:
+            row = rows.get(lbl)
+            # unconfigured labels get a vector built against the current vocabulary
+            vec = matrix[row] if row is not None else self._vector(lbl, vocab, idf)
+            out.append(float(vec @ doc) if len(doc) else 0.0)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"labels": len(self._labels), "tokenizers": len(self._tokenizers),
+                    "vector_dims": len(self._vocab), **self._stats}
+
+
+INDEX = LabelIndex()
@@ -0,0 +1,301 @@
+# Process-wide registry of loaded checkpoints.
+# Each (checkpoint, model class) is loaded once; task pipelines are thin
+# facades built over the shared model and tokenizer, so e.g. the summarizer
+# and the text2text extractor in cv_parser use the same bart-large-cnn
+# weights instead of two copies.
+#
+# Nothing is loaded at import time. Each role (zero_shot, summarizer,
+# extractor, spacy) loads on first use via load(), in a background thread
+# started once the server is accepting connections (start_background), or
+# up front within a time budget in the gunicorn master (preload). status()
+# reports per-role state and load duration for /ready.
+#
+# MODEL_QUANTIZE=int8 (CPU only) applies dynamic int8 quantization to every
+# nn.Linear of each loaded model. The quantized state dict is cached under
+# QUANTIZED_MODEL_DIR so later starts build the model from its config and load
+# the int8 weights directly, skipping the fp32 load and the quantization pass.
+#
+# NLI_BACKEND=onnx (CPU only) serves sequence-classification models (the
+# zero-shot classifiers) through ONNX Runtime instead; see onnx_backend.
+import os
+import hashlib
+import sys
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("model_registry")
+
+# Checkpoint names can be overridden per role (e.g. a distilled summarizer)
+ZERO_SHOT_MODEL = os.environ.get("ZERO_SHOT_MODEL", "facebook/bart-large-mnli")
+SUMMARIZER_MODEL = os.environ.get("SUMMARIZER_MODEL", "facebook/bart-large-cnn")
+EXTRACTOR_MODEL = os.environ.get("EXTRACTOR_MODEL", "facebook/bart-large-cnn")
+SPACY_MODEL = os.environ.get("SPACY_MODEL", "en_core_web_sm")
+# set to 0 to never shell out to `spacy download` when the package is missing
+SPACY_AUTO_DOWNLOAD = os.environ.get("SPACY_AUTO_DOWNLOAD", "1") != "0"
+# "" (fp32, default) or "int8": dynamic quantization of Linear layers on CPU
+MODEL_QUANTIZE = os.environ.get("MODEL_QUANTIZE", "").strip().lower()
+QUANTIZED_MODEL_DIR = os.environ.get("QUANTIZED_MODEL_DIR", os.path.join(".cache", "quantized"))
+# "torch" (default) or "onnx" for the zero-shot NLI models
+NLI_BACKEND = os.environ.get("NLI_BACKEND", "torch").strip().lower()
+# seconds the gunicorn master may spend preloading before forking workers
+MODEL_STARTUP_BUDGET_SEC = float(os.environ.get("MODEL_STARTUP_BUDGET_SEC", "120"))
+
+NOT_LOADED, LOADING, READY, FAILED = "not_loaded", "loading", "ready", "failed"
+
+# pipeline task -> transformers Auto* class that backs it
+_TASK_MODEL_CLASS = {
+    "summarization": "AutoModelForSeq2SeqLM",
+    "text2text-generation": "AutoModelForSeq2SeqLM",
+    "zero-shot-classification": "AutoModelForSequenceClassification",
+}
+
+_lock = threading.RLock()
+_models: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_pipelines: Dict[Tuple[str, str, int], Any] = {}
+
+
+class ModelUnavailable(RuntimeError):
+    """Raised by load() when a role failed to load."""
+
+
+def _param_bytes(model) -> int:
+    """Bytes held by the weights (shared/tied tensors counted once, int8 packed weights included)."""
+    import torch
+    seen, total = set(), 0
+    tensors = []
+    for value in model.state_dict(keep_vars=True).values():
+        # quantized Linear layers keep (weight, bias) in a tuple
+        tensors.extend(value if isinstance(value, tuple) else [value])
+    for t in tensors:
+        if not isinstance(t, torch.Tensor):
+            continue
+        ptr = t.data_ptr()
+        if ptr in seen:
+            continue
+        seen.add(ptr)
+        total += t.numel() * t.element_size()
+    return total
+
+
+def _quantize(model):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _quantized_path(name: str, model_class: str) -> str:
+    import torch
+    import transformers
+    # the packed int8 format is tied to the torch/transformers versions that wrote it
+    tag = hashlib.sha1(f"{name}|{model_class}|{torch.__version__}|{transformers.__version__}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(QUANTIZED_MODEL_DIR, f"{os.path.basename(name.rstrip('/'))}-{tag}-int8.pt")
+
+
+def _load_quantized(name: str, model_class: str):
+    """int8 model for `name`, from the on-disk cache when present."""
+    import torch
+    import transformers
+    cls = getattr(transformers, model_class)
+    path = _quantized_path(name, model_class)
+    if os.path.exists(path):
+        try:
+            from transformers.modeling_utils import no_init_weights
+            with no_init_weights():
+                model = cls.from_config(transformers.AutoConfig.from_pretrained(name))
+            model = _quantize(model.eval())
+            model.load_state_dict(torch.load(path, map_location="cpu", weights_only=False))
+            logger.info("Loaded int8 weights for %s from %s", name, path)
+            return model
+        except Exception as e:
+            logger.warning("Ignoring quantized cache %s: %s", path, e)
+    model = _quantize(cls.from_pretrained(name).eval())
+    try:
+        os.makedirs(QUANTIZED_MODEL_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.save(model.state_dict(), tmp)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Could not write quantized cache %s: %s", path, e)
+    return model
+
+
+def get_model(name: str, model_class: str, device: int = -1):
+    """(model, tokenizer) for `name`, loading it on first use."""
+    key = (name, model_class)
+    entry = _models.get(key)
+    if entry is None:
+        with _lock:
+            entry = _models.get(key)
+            if entry is None:
+                import transformers
+                import torch
+                started = time.perf_counter()
+                tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+                on_gpu = device >= 0 and torch.cuda.is_available()
+                backend = "torch"
+                if NLI_BACKEND == "onnx" and model_class == "AutoModelForSequenceClassification":
+                    if on_gpu:
+                        logger.warning("NLI_BACKEND=onnx ignored for %s (CPU only)", name)
+                    else:
+                        backend = "onnx"
+                quantized = MODEL_QUANTIZE == "int8" and not on_gpu and backend == "torch"
+                if MODEL_QUANTIZE and not quantized:
+                    logger.warning("MODEL_QUANTIZE=%s ignored for %s (only int8 on CPU with the torch backend)",
+                                   MODEL_QUANTIZE, name)
+                if backend == "onnx":
+                    import onnx_backend
+                    model = onnx_backend.load(name, tokenizer)
+                elif quantized:
+                    model = _load_quantized(name, model_class)
+                else:
+                    model = getattr(transformers, model_class).from_pretrained(name)
+                if on_gpu:
+                    model.to(f"cuda:{device}")
+                model.eval()
+                entry = _models[key] = {
+                    "model": model,
+                    "tokenizer": tokenizer,
+                    "load_seconds": round(time.perf_counter() - started, 3),
+                    "bytes": os.path.getsize(model.path) if backend == "onnx" else _param_bytes(model),
+                    "backend": backend,
+                    "quantized": "int8" if quantized else None,
+                    "tasks": [],
+                }
+                logger.info("Loaded %s (%s) in %.1fs, %.0f MB", name, model_class,
+                            entry["load_seconds"], entry["bytes"] / (1024 * 1024))
+    return entry["model"], entry["tokenizer"]
+
+
+def get_pipeline(task: str, name: str, device: int = -1):
+    """Task pipeline over the shared model for `name`; built once per (task, name, device)."""
+    key = (task, name, device)
+    pipe = _pipelines.get(key)
+    if pipe is None:
+        with _lock:
+            pipe = _pipelines.get(key)
+            if pipe is None:
+                from transformers import pipeline
+                model_class = _TASK_MODEL_CLASS[task]
+                model, tokenizer = get_model(name, model_class, device)
+                pipe = _pipelines[key] = pipeline(task, model=model, tokenizer=tokenizer, device=device, framework="pt")
+                _models[(name, model_class)]["tasks"].append(task)
+    return pipe
+
+
+def _device() -> int:
+    import torch
+    return 0 if torch.cuda.is_available() else -1
+
+
+def _load_spacy():
+    import spacy
+    try:
+        return spacy.load(SPACY_MODEL)
+    except OSError:
+        if not SPACY_AUTO_DOWNLOAD:
+            raise
+        import subprocess
+        logger.info("spaCy model %s not found, downloading", SPACY_MODEL)
+        subprocess.check_call([sys.executable, "-m", "spacy", "download", SPACY_MODEL])
+        return spacy.load(SPACY_MODEL)
+
+
+# role -> (checkpoint shown in /ready, loader); listed in preload order
+ROLES: Dict[str, Tuple[str, Callable[[], Any]]] = {
+    "zero_shot": (ZERO_SHOT_MODEL, lambda: get_pipeline("zero-shot-classification", ZERO_SHOT_MODEL, _device())),
+    "extractor": (EXTRACTOR_MODEL, lambda: get_pipeline("text2text-generation", EXTRACTOR_MODEL, _device())),
+    "summarizer": (SUMMARIZER_MODEL, lambda: get_pipeline("summarization", SUMMARIZER_MODEL, _device())),
+    "spacy": (SPACY_MODEL, _load_spacy),
+}
+
+_roles: Dict[str, Dict[str, Any]] = {
+    role: {"state": NOT_LOADED, "value": None, "seconds": None, "error": None, "lock": threading.Lock()}
+    for role in ROLES
+}
+_background_pid: Optional[int] = None
+
+
+def load(role: str, retry: bool = False):
+    """Return the loaded object for `role`, loading it now if needed.
+    Raises ModelUnavailable (a RuntimeError) if it failed to load (again only with retry=True)."""
+    entry = _roles[role]
+    if entry["state"] == READY:
+        return entry["value"]
+    with entry["lock"]:
+        if entry["state"] == FAILED and not retry:
+            raise ModelUnavailable(f"{role} model unavailable: {entry['error']}")
+        if entry["state"] != READY:
+            entry["state"] = LOADING
+            started = time.perf_counter()
+            try:
+                value = ROLES[role][1]()
+            except Exception as e:
+                entry.update(state=FAILED, error=str(e), seconds=round(time.perf_counter() - started, 3))
+                logger.warning("Could not load %s model: %s", role, e)
+                raise ModelUnavailable(f"{role} model unavailable: {e}") from e
+            entry.update(state=READY, value=value, error=None, seconds=round(time.perf_counter() - started, 3))
+    return entry["value"]
+
+
+def failed(role: str) -> bool:
+    """True when `role` already failed to load (load() would raise without retry)."""
+    return _roles[role]["state"] == FAILED
+
+
+def get(role: str):
+    """Like load(), but None instead of an exception when the model is unavailable."""
+    try:
+        return load(role)
+    except RuntimeError:
+        return None
+
+
+def preload(budget_sec: float | None = None, roles: List[str] | None = None) -> List[str]:
+    """Load roles in order until the budget is spent; returns those left for later."""
+    budget = MODEL_STARTUP_BUDGET_SEC if budget_sec is None else budget_sec
+    deadline = time.monotonic() + budget
+    pending = list(roles or ROLES)
+    while pending and time.monotonic() < deadline:
+        get(pending.pop(0))
+    return [role for role in pending if _roles[role]["state"] == NOT_LOADED]
+
+
+def start_background(roles: List[str] | None = None) -> None:
+    """Load whatever is still missing in a daemon thread (once per process)."""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    pending = [role for role in (roles or ROLES) if _roles[role]["state"] == NOT_LOADED]
+    if pending:
+        threading.Thread(target=lambda: [get(role) for role in pending],
+                         name="model-loader", daemon=True).start()
+
+
+def status() -> Dict[str, Any]:
+    roles = {
+        role: {"model": ROLES[role][0], "state": entry["state"],
+               "load_seconds": entry["seconds"], "error": entry["error"]}
+        for role, entry in _roles.items()
+    }
+    settled = all(r["state"] in (READY, FAILED) for r in roles.values())
+    return {"ready": settled, "degraded": any(r["state"] == FAILED for r in roles.values()), "models": roles}
+
+
+def stats() -> Dict[str, Any]:
+    # no lock: _lock is held for the whole duration of a load
+    models = {
+        f"{name} ({model_class})": {
+            "tasks": list(entry["tasks"]),
+            "backend": entry["backend"],
+            "quantized": entry["quantized"],
+            "load_seconds": entry["load_seconds"],
+            "param_mb": round(entry["bytes"] / (1024 * 1024), 1),
+        }
+        for (name, model_class), entry in list(_models.items())
+    }
+    return {
+        "models": models,
+        "total_param_mb": round(sum(m["param_mb"] for m in models.values()), 1),
+    }
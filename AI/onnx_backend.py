@@ -0,0 +1,101 @@
+# ONNX Runtime backend for the zero-shot NLI classifier (NLI_BACKEND=onnx).
+# The sequence-classification model is exported to ONNX once and cached under
+# ONNX_CACHE_DIR; later starts only read the config and open the cached graph.
+# OnnxSequenceClassifier stands in for the torch model inside the normal HF
+# zero-shot pipeline (and zero_shot.score_pairs), so callers still get the same
+# labels/scores output. Needs the optional onnx + onnxruntime packages.
+import os
+import hashlib
+import inspect
+import logging
+from typing import List
+
+import torch
+
+logger = logging.getLogger("onnx_backend")
+
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR", os.path.join(".cache", "onnx"))
+# 0 = follow torch.get_num_threads(), which gunicorn post_fork sizes per worker
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_OPSET = int(os.environ.get("ONNX_OPSET", "14"))
+
+_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def onnx_path(name: str) -> str:
+    import transformers
+    tag = hashlib.sha1(f"{name}|{ONNX_OPSET}|{torch.__version__}|{transformers.__version__}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(ONNX_CACHE_DIR, f"{os.path.basename(name.rstrip('/'))}-{tag}.onnx")
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Positional-argument wrapper so the export sees exactly the tokenizer's inputs."""
+
+    def __init__(self, model, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *args):
+        return self.model(**dict(zip(self.input_names, args))).logits
+
+
+def export(name: str, tokenizer, path: str) -> None:
+    """Export `name` (AutoModelForSequenceClassification) to `path` with dynamic batch/sequence axes."""
+    import transformers
+    model = transformers.AutoModelForSequenceClassification.from_pretrained(name).eval()
+    dummy = tokenizer("A short premise.", "This example is a label.", return_tensors="pt")
+    input_names = [k for k in _INPUT_NAMES if k in dummy]
+    axes = {k: {0: "batch", 1: "sequence"} for k in input_names}
+    axes["logits"] = {0: "batch"}
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(_LogitsOnly(model, input_names), tuple(dummy[k] for k in input_names), tmp,
+                          input_names=input_names, output_names=["logits"], dynamic_axes=axes,
+                          opset_version=ONNX_OPSET, **kwargs)
+    os.replace(tmp, path)
+    logger.info("Exported %s to %s", name, path)
+
+
+class OnnxSequenceClassifier(torch.nn.Module):
+    """Duck-types the parts of a PreTrainedModel the zero-shot pipeline uses (CPU only)."""
+
+    def __init__(self, name: str, path: str):
+        super().__init__()
+        import onnxruntime as ort
+        import transformers
+        self.config = transformers.AutoConfig.from_pretrained(name)
+        self.name_or_path = name
+        self.path = path
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS or torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._inputs = [i.name for i in self.session.get_inputs()]
+
+    @property
+    def device(self) -> torch.device:
+        return torch.device("cpu")
+
+    def can_generate(self) -> bool:
+        return False
+
+    def forward(self, input_ids=None, attention_mask=None, token_type_ids=None, **_):
+        from transformers.modeling_outputs import SequenceClassifierOutput
+        given = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        feed = {k: given[k].cpu().numpy() for k in self._inputs if given.get(k) is not None}
+        if "attention_mask" in self._inputs and "attention_mask" not in feed:
+            feed["attention_mask"] = torch.ones_like(input_ids).cpu().numpy()
+        logits = self.session.run(["logits"], feed)[0]
+        return SequenceClassifierOutput(logits=torch.from_numpy(logits))
+
+
+def load(name: str, tokenizer) -> OnnxSequenceClassifier:
+    """ONNX model for `name`, exporting it on first use."""
+    path = onnx_path(name)
+    if not os.path.exists(path):
+        export(name, tokenizer, path)
+    return OnnxSequenceClassifier(name, path)
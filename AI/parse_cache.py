@@ -0,0 +1,141 @@
+# Persistent per-stage memoization for /parse_resume.
+# Each document (keyed by the SHA-256 of its bytes) gets one JSON file holding
+# the output of every parse stage together with the stage's effective version.
+# A stage's effective version covers its own version, the variant it ran in
+# (e.g. with or without the generation model) and the effective versions of
+# the stages it reads from, so bumping one extractor only re-runs that stage
+# and whatever consumes it. A stage that fell back because a model call failed
+# (see mark_degraded) is not recorded. The files hold parsed personal data, so
+# they expire PARSE_CACHE_TTL_SEC after they were last written.
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from typing import Any, Callable, Dict, List, Mapping
+
+logger = logging.getLogger("parse_cache")
+
+PARSE_CACHE_DIR = os.environ.get("PARSE_CACHE_DIR", os.path.join(".cache", "parse_resume"))
+PARSE_CACHE_TTL_SEC = float(os.environ.get("PARSE_CACHE_TTL_SEC", "3600"))
+
+_write_lock = threading.Lock()
+_last_prune = 0.0
+# set by StageMemo.run while a stage computes; mark_degraded() flags it
+_degraded: contextvars.ContextVar = contextvars.ContextVar("parse_stage_degraded", default=None)
+
+
+def mark_degraded() -> None:
+    """Called when the running stage falls back (e.g. a model call failed): its result is not memoized."""
+    flags = _degraded.get()
+    if flags is not None:
+        flags.append(True)
+
+
+def effective_versions(versions: Mapping[str, int], deps: Mapping[str, List[str]]) -> Dict[str, str]:
+    """Fold each stage's dependency chain into a short version hash."""
+    out: Dict[str, str] = {}
+
+    def resolve(stage: str) -> str:
+        if stage not in out:
+            parts = [f"{stage}@{versions[stage]}"] + [resolve(d) for d in deps.get(stage, [])]
+            out[stage] = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:12]
+        return out[stage]
+
+    for stage in versions:
+        resolve(stage)
+    return out
+
+
+class StageMemo:
+    """Stage results for one document; run() returns the cached value or computes and records it.
+    Stages of one document may run on several threads at once."""
+
+    def __init__(self, path: str | None, versions: Dict[str, str]):
+        self.path = path
+        self.versions = versions
+        self.hits: List[str] = []
+        self.misses: List[str] = []
+        self._dirty = False
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                if time.time() - os.path.getmtime(path) > PARSE_CACHE_TTL_SEC:
+                    os.remove(path)
+                else:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+            except Exception as e:
+                logger.warning("Ignoring unreadable parse cache %s: %s", path, e)
+
+    def _version(self, stage: str, variant: str) -> str:
+        return f"{self.versions.get(stage, '0')}:{variant}" if variant else self.versions.get(stage, "0")
+
+    def cached(self, stage: str, variant: str = "") -> bool:
+        """True when run(stage, ..., variant) would be served from the cache."""
+        entry = self._entries.get(stage)
+        return entry is not None and entry.get("version") == self._version(stage, variant)
+
+    def run(self, stage: str, fn: Callable[[], Any], variant: str = "") -> Any:
+        version = self._version(stage, variant)
+        entry = self._entries.get(stage)
+        if entry is not None and entry.get("version") == version:
+            with self._lock:
+                self.hits.append(stage)
+            return entry["value"]
+        flags: List[bool] = []
+        token = _degraded.set(flags)
+        try:
+            value = fn()
+        finally:
+            _degraded.reset(token)
+        with self._lock:
+            self.misses.append(stage)
+            if not flags:
+                self._entries[stage] = {"version": version, "value": value}
+                self._dirty = True
+        return value
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            entries = dict(self._entries)  # stages may still be finishing on other threads
+            self._dirty = False
+        try:
+            with _write_lock:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            with self._lock:
+                self._dirty = True
+            logger.warning("Could not write parse cache %s: %s", self.path, e)
+
+
+def open_memo(doc_hash: str, versions: Dict[str, str]) -> StageMemo:
+    """Memo for `doc_hash`; in-memory only when PARSE_CACHE_DIR is empty."""
+    path = os.path.join(PARSE_CACHE_DIR, f"{doc_hash}.json") if PARSE_CACHE_DIR else None
+    _prune()
+    return StageMemo(path, versions)
+
+
+def _prune() -> None:
+    """Drop expired files (checked at most once a minute)."""
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 60 or not PARSE_CACHE_DIR or not os.path.isdir(PARSE_CACHE_DIR):
+        return
+    _last_prune = now
+    for name in os.listdir(PARSE_CACHE_DIR):
+        path = os.path.join(PARSE_CACHE_DIR, name)
+        try:
+            if name.endswith(".json") and now - os.path.getmtime(path) > PARSE_CACHE_TTL_SEC:
+                os.remove(path)
+        except OSError:
+            pass
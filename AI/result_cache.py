@@ -0,0 +1,116 @@
+# Content-addressed cache for classification results.
+# Entries are kept as serialized JSON in an LRU bounded by a byte budget;
+# evicted entries optionally spill to a directory on disk and are promoted
+# back into memory on the next hit.
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("result_cache")
+
+
+def make_key(data: bytes, *parts: Any) -> str:
+    """SHA-256 of the document bytes plus any extra key parts (category version, top_k, ...)."""
+    h = hashlib.sha256(data)
+    for part in parts:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, spill_dir: str | None = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or None
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "clears": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.json")
+
+    def _insert(self, key: str, raw: bytes) -> None:
+        """Insert under the lock and evict least-recently-used entries past the budget."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        if len(raw) > self.max_bytes:
+            self._spill(key, raw)
+            return
+        self._entries[key] = raw
+        self._bytes += len(raw)
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, old_raw = self._entries.popitem(last=False)
+            self._bytes -= len(old_raw)
+            self._stats["evictions"] += 1
+            self._spill(old_key, old_raw)
+
+    def _spill(self, key: str, raw: bytes) -> None:
+        if not self.spill_dir:
+            return
+        try:
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(raw)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning("Result cache spill failed: %s", e)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return json.loads(raw)
+        if self.spill_dir:
+            try:
+                with open(self._path(key), "rb") as f:
+                    raw = f.read()
+            except OSError:
+                raw = None
+            if raw is not None:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._insert(key, raw)
+                return json.loads(raw)
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._insert(key, raw)
+
+    def clear(self, *_args) -> None:
+        """Drop every entry (memory and disk). Accepts and ignores subscriber arguments."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stats["clears"] += 1
+        if self.spill_dir:
+            for name in os.listdir(self.spill_dir):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.spill_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats["hits"] + self._stats["disk_hits"]
+            total = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,150 @@
+# Section index for CV text.
+# The parser looks up sections ("skills", "work experience", "education", ...)
+# many times per document with overlapping keyword lists, and every lookup used
+# to split the text and rescan it line by line. SectionIndex splits and
+# lowercases the text once; a lookup is one str.find per keyword over the
+# lowercased text (bounded by the earliest heading found so far), mapped to its
+# line by bisecting the line offsets, and the end of the section (the next line
+# mentioning one of SECTION_HEADERS) is found the same way. Every occurrence
+# found, and how far each keyword has been searched, is kept, so no stretch of
+# text is searched twice for the same word. Results are identical to the old
+# line scan (first line containing any of the keywords, up to the next heading
+# line). to_dict()/from_dict() store the (start, end) offsets of every
+# VOCABULARY keyword next to the text, so parsing a stored document turns
+# section lookups into dict accesses without scanning it at all.
+import bisect
+import threading
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# bump when the offsets change meaning, so stored indexes are rebuilt
+INDEX_VERSION = 1
+HEADING_MAX_LEN = 100
+
+# headings that end a section
+SECTION_HEADERS = ['experience', 'education', 'skills', 'projects', 'contact',
+                   'summary', 'objective', 'certifications', 'languages', 'references']
+
+# every keyword cv_parser looks sections up by (what to_dict stores)
+VOCABULARY = sorted(set(SECTION_HEADERS + [
+    'personal projects', 'academic projects', 'undergraduate projects', 'technical projects',
+    'project experience', 'project work', 'major projects', 'key projects', 'significant projects',
+    'notable projects', 'work experience', 'professional experience', 'employment history',
+    'employment', 'work history', 'career', 'academic background', 'qualifications',
+    'educational background', 'degrees', 'technical skills', 'competencies', 'strengths',
+    'technologies',
+]))
+
+
+class SectionIndex:
+    """Sections of one text: char offsets of the body under the first heading line among some keywords."""
+
+    def __init__(self, text: str, offsets: Optional[Dict[str, Optional[Tuple[int, int]]]] = None):
+        self.text = text
+        # keyword -> (start, end) of its section, None if it heads no line (stored index, see from_dict)
+        self._offsets: Dict[str, Optional[Tuple[int, int]]] = dict(offsets or {})
+        self._lock = threading.Lock()
+        self._lines: Optional[List[str]] = None
+        self._line_starts: List[int] = []
+        self._lower: Optional[str] = None
+        self._short: Dict[int, bool] = {}
+        # keyword -> (short lines containing it found so far, next line to search from or None when done)
+        self._hits: Dict[str, Tuple[List[int], Optional[int]]] = {}
+
+    def _prepare(self) -> None:
+        if self._lines is not None:
+            return
+        self._lines = self.text.split("\n")
+        # start offset of each line: running sum of len(line) + 1 for the "\n"
+        self._line_starts = list(accumulate(map((1).__add__, map(len, self._lines[:-1])), initial=0))
+        lower = self.text.lower()
+        # lowercasing can change lengths (e.g. "İ"); offsets then don't line up and lines are scanned one by one
+        self._lower = lower if len(lower) == len(self.text) else None
+
+    def _is_short(self, line_no: int) -> bool:
+        short = self._short.get(line_no)
+        if short is None:
+            short = self._short[line_no] = len(self._lines[line_no].strip()) < HEADING_MAX_LEN
+        return short
+
+    def _next_line(self, keyword: str, after: int, limit: Optional[int] = None) -> Optional[int]:
+        """
+        First short line in (after, limit) containing `keyword`, or None. The
+        lines found and how far the text has been searched are remembered, so
+        no stretch of text is searched twice for the same keyword.
+        """
+        n = len(self._lines)
+        limit = n if limit is None else limit
+        hits, frontier = self._hits.get(keyword, ([], 0))
+        while (not hits or hits[-1] <= after) and frontier is not None and frontier < limit:
+            line_no = None
+            if self._lower is None:
+                for j in range(frontier, limit):
+                    if keyword in self._lines[j].strip().lower():
+                        line_no = j
+                        break
+            else:
+                end = self._line_starts[limit] if limit < n else len(self._lower)
+                pos = self._lower.find(keyword, self._line_starts[frontier], end)
+                if pos != -1:
+                    line_no = bisect.bisect_right(self._line_starts, pos) - 1
+            if line_no is None:
+                frontier = limit if limit < n else None
+                break
+            if self._is_short(line_no):
+                hits.append(line_no)
+            frontier = line_no + 1 if line_no + 1 < n else None
+        self._hits[keyword] = (hits, frontier)
+        i = bisect.bisect_right(hits, after)
+        return hits[i] if i < len(hits) and hits[i] < limit else None
+
+    def _first_line(self, keywords: Iterable[str], after: int = -1) -> Optional[int]:
+        """First short line after `after` containing any of `keywords`."""
+        best = None
+        for kw in keywords:
+            line_no = self._next_line(kw, after, best)
+            if line_no is not None:
+                best = line_no
+        return best
+
+    def _body(self, line_no: int) -> Tuple[int, int]:
+        """Offsets of the lines after `line_no` up to the next heading line (exclusive)."""
+        starts = self._line_starts
+        end_line = self._first_line(SECTION_HEADERS, line_no)
+        end_line = len(starts) if end_line is None else end_line
+        start = starts[line_no + 1] if line_no + 1 < len(starts) else len(self.text)
+        end = starts[end_line] - 1 if end_line < len(starts) else len(self.text)
+        return start, max(end, start)
+
+    def span(self, keywords: Iterable[str]) -> Optional[Tuple[int, int]]:
+        """Offsets of the section whose heading line comes first among `keywords`, or None."""
+        keywords = list(keywords)
+        offsets = self._offsets
+        if all(kw in offsets for kw in keywords):
+            hits = [offsets[kw] for kw in keywords if offsets[kw] is not None]
+            return min(hits) if hits else None
+        with self._lock:
+            self._prepare()
+            line_no = self._first_line(keywords)
+            return self._body(line_no) if line_no is not None else None
+
+    def find(self, keywords: Iterable[str]) -> str:
+        """Section body text (without its heading line), or "" if no keyword heads a line."""
+        hit = self.span(keywords)
+        return self.text[hit[0]:hit[1]] if hit else ""
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        """Offsets of every VOCABULARY keyword found in the text, for storing alongside it."""
+        out = {}
+        for kw in VOCABULARY:
+            hit = self.span([kw])
+            if hit is not None:
+                out[kw] = list(hit)
+        return out
+
+    @classmethod
+    def from_dict(cls, text: str, offsets: Dict[str, List[int]]) -> "SectionIndex":
+        """Index for `text` from to_dict() output; VOCABULARY keywords not in it are absent from the text."""
+        stored: Dict[str, Optional[Tuple[int, int]]] = {w: None for w in VOCABULARY}
+        stored.update((k, (v[0], v[1])) for k, v in offsets.items())
+        return cls(text, stored)
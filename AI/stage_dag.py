@@ -0,0 +1,80 @@
+# Dependency-ordered concurrent execution of parse stages.
+# Each stage names the stages it reads from and the pool it runs on; a stage is
+# submitted as soon as all of its dependencies have finished, and results are
+# yielded in completion order. Pools are shared by every request in the process:
+# "model" bounds how many model-bound stages run at once (their prompts still
+# meet in the generation micro-batcher), "cpu" runs the regex-only stages.
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+PARSE_CPU_THREADS = int(os.environ.get("PARSE_CPU_THREADS", "4"))
+PARSE_MODEL_THREADS = int(os.environ.get("PARSE_MODEL_THREADS", "4"))
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_pid = None
+_lock = threading.Lock()
+
+
+class Stage(NamedTuple):
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]  # called with the results of the finished stages
+    deps: Tuple[str, ...] = ()
+    pool: str = "cpu"  # "cpu" or "model"
+
+
+def _pool(kind: str) -> ThreadPoolExecutor:
+    # (re)create after fork: pool threads do not survive into gunicorn workers
+    global _pools_pid
+    with _lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if kind not in _pools:
+            size = PARSE_MODEL_THREADS if kind == "model" else PARSE_CPU_THREADS
+            _pools[kind] = ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f"stage-{kind}")
+        return _pools[kind]
+
+
+def _timed(fn: Callable[[Dict[str, Any]], Any], results: Dict[str, Any]) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    value = fn(results)
+    return value, time.perf_counter() - t0
+
+
+def run(stages: List[Stage], results: Dict[str, Any] | None = None) -> Iterator[Tuple[str, Any, float]]:
+    """
+    Run `stages` (a DAG; `results` may hold values of already-finished stages)
+    and yield (name, value, seconds) as each stage completes. The first stage
+    error is re-raised; closing the generator cancels stages not yet started.
+    """
+    results = dict(results or {})
+    known = set(results) | {s.name for s in stages}
+    for s in stages:
+        missing = [d for d in s.deps if d not in known]
+        if missing:
+            raise ValueError(f"Stage {s.name} depends on unknown stage(s): {', '.join(missing)}")
+
+    waiting = list(stages)
+    running: Dict[Any, Stage] = {}
+    try:
+        while waiting or running:
+            for s in [s for s in waiting if all(d in results for d in s.deps)]:
+                waiting.remove(s)
+                # each stage runs in a copy of the caller's context (e.g. its token_cache scope)
+                ctx = contextvars.copy_context()
+                running[_pool(s.pool).submit(ctx.run, _timed, s.fn, dict(results))] = s
+            if not running:
+                raise ValueError(f"Stage dependency cycle among: {', '.join(s.name for s in waiting)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                s = running.pop(fut)
+                value, seconds = fut.result()
+                results[s.name] = value
+                yield s.name, value, seconds
+    finally:
+        for fut in running:
+            fut.cancel()
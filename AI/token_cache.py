@@ -0,0 +1,104 @@
+# Per-request tokenization cache.
+# A single upload used to tokenize the same CV text once per category and once
+# per generation prompt. Everything that needs token ids goes through encode()
+# so a text is tokenized once per tokenizer inside a request scope.
+import bisect
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Any
+
+_current: contextvars.ContextVar = contextvars.ContextVar("token_cache", default=None)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _count(hit: bool) -> None:
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+
+
+def tokenizer_key(tokenizer) -> str:
+    return f"{type(tokenizer).__name__}:{getattr(tokenizer, 'name_or_path', '')}"
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def _tokenize(tokenizer, text: str) -> Dict[str, Any]:
+    """Tokenize without special tokens; keep char offsets when the tokenizer is fast."""
+    if getattr(tokenizer, "is_fast", False):
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return {"input_ids": list(enc["input_ids"]), "offsets": [tuple(o) for o in enc["offset_mapping"]]}
+    enc = tokenizer(text, add_special_tokens=False)
+    return {"input_ids": list(enc["input_ids"]), "offsets": None}
+
+
+class TokenCache:
+    """Tokenizations keyed by (tokenizer, text hash) for the lifetime of one scope."""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tokenizer, text: str) -> Dict[str, Any]:
+        key = (tokenizer_key(tokenizer), text_key(text))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            _count(True)
+            return entry
+        _count(False)
+        entry = _tokenize(tokenizer, text)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+
+@contextmanager
+def scope():
+    """Open a request scope, or join the one already active in this context."""
+    active = _current.get()
+    if active is not None:
+        yield active
+        return
+    token = _current.set(TokenCache())
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def encode(tokenizer, text: str, max_chars: int | None = None) -> List[int]:
+    """
+    Token ids (no special tokens) for text[:max_chars]. The full text is tokenized
+    once per scope; prefixes are sliced from it using the char offsets, so prompts
+    built around text[:800] / text[:1500] / text[:2000] share one tokenization.
+    """
+    if max_chars is not None and max_chars >= len(text):
+        max_chars = None
+    cache = _current.get()
+    if cache is None:
+        _count(False)
+        entry = _tokenize(tokenizer, text)
+    else:
+        entry = cache.get(tokenizer, text)
+
+    ids = entry["input_ids"]
+    if max_chars is None:
+        return list(ids)
+    offsets = entry["offsets"]
+    if offsets is None:
+        # slow tokenizer: no offsets, tokenize the prefix itself (cached on its own)
+        return encode(tokenizer, text[:max_chars])
+    n = bisect.bisect_right(offsets, max_chars, key=lambda o: o[1])
+    return list(ids[:n])
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": round(hits / total, 4) if total else 0.0}
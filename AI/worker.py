@@ -1,58 +1,215 @@
-import os, json, time, glob
+import os, json, ctypes, ctypes.util, threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
-from config_store import load_categories, last_modified
+from config_store import snapshot
 from bart_model import classify_text_by_categories
 
-INBOX = os.environ.get("WORKER_INBOX", "inbox")      # drop *.json jobs here
+INBOX = os.environ.get("WORKER_INBOX", "inbox")      # drop *.json jobs here (write *.tmp, then rename)
 OUTBOX = os.environ.get("WORKER_OUTBOX", "outbox")   # results go here
-os.makedirs(INBOX, exist_ok=True)
-os.makedirs(OUTBOX, exist_ok=True)
+PROCESSING = os.environ.get("WORKER_PROCESSING", "processing")  # claimed jobs, prefixed with the worker pid
+DEADLETTER = os.environ.get("WORKER_DEADLETTER", "deadletter")  # jobs that failed WORKER_MAX_ATTEMPTS times
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", str(os.cpu_count() or 2)))
+WORKER_MAX_ATTEMPTS = int(os.environ.get("WORKER_MAX_ATTEMPTS", "3"))
+WORKER_RETRY_DELAY_SEC = float(os.environ.get("WORKER_RETRY_DELAY_SEC", "5"))
+# rescan interval: the only pickup mechanism without inotify, a safety net with it
+WORKER_POLL_SEC = float(os.environ.get("WORKER_POLL_SEC", "0.25"))
+for _d in (INBOX, OUTBOX, PROCESSING, DEADLETTER):
+    os.makedirs(_d, exist_ok=True)
+
+class PermanentJobError(ValueError):
+    """The job itself is invalid (bad JSON, no text): dead-lettered without retries."""
 
 def read_job(path: str) -> Dict:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            job = json.load(f)
+    except ValueError as e:
+        raise PermanentJobError(f"invalid job JSON: {e}")
+    if not isinstance(job, dict):
+        raise PermanentJobError("job JSON is not an object")
+    return job
+
+def _write_json(path: str, data: Dict):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
 
 def write_result(job_id: str, result: Dict):
-    out_path = os.path.join(OUTBOX, f"{job_id}.result.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    _write_json(os.path.join(OUTBOX, f"{job_id}.result.json"), result)
+
+# ---------- Inbox watching ----------
+_IN_CLOSE_WRITE, _IN_MOVED_TO = 0x8, 0x80
+
+def watch_inbox(wake: threading.Event) -> bool:
+    """Set `wake` whenever a file is written or renamed into INBOX (Linux inotify via libc).
+    Returns False when inotify is unavailable and the caller has to rely on polling."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return False
+        if libc.inotify_add_watch(fd, os.fsencode(os.path.abspath(INBOX)), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            os.close(fd)
+            return False
+    except (OSError, AttributeError):
+        return False
+
+    def loop():
+        while True:
+            os.read(fd, 4096)  # event details don't matter: any event means "rescan"
+            wake.set()
+
+    threading.Thread(target=loop, name="inbox-watch", daemon=True).start()
+    return True
+
+# ---------- Claiming ----------
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def claim(name: str) -> str | None:
+    """Atomically move an inbox job into PROCESSING; None if another worker got it first."""
+    dst = os.path.join(PROCESSING, f"{os.getpid()}.{name}")
+    try:
+        os.rename(os.path.join(INBOX, name), dst)
+    except FileNotFoundError:
+        return None
+    return dst
+
+def recover_orphans():
+    """Requeue jobs left in PROCESSING by workers that are no longer running.
+    Run at startup only: a job under our own pid then belongs to a previous
+    worker that had the same pid (e.g. pid 1 in a restarted container)."""
+    for name in os.listdir(PROCESSING):
+        pid, _, original = name.partition(".")
+        if pid.isdigit() and original and (int(pid) == os.getpid() or not _pid_alive(int(pid))):
+            os.replace(os.path.join(PROCESSING, name), os.path.join(INBOX, original))
+            print(f"[worker] requeued orphaned job {original} from pid {pid}")
+
+def pending_jobs() -> List[str]:
+    with os.scandir(INBOX) as it:
+        return sorted(e.name for e in it if e.is_file() and e.name.endswith(".json"))
+
+# ---------- Processing ----------
+def process(path: str, name: str):
+    """Run one claimed job; on failure retry it later or dead-letter it (never drop it)."""
+    job = None
+    try:
+        job = read_job(path)
+        job_id = job.get("id") or os.path.splitext(name)[0]
+        text = job.get("text") or ""
+        if not text.strip():
+            raise PermanentJobError("empty text")
 
-def main_loop(poll_sec: float = 2.0):
+        # micro-batching in zero_shot merges the NLI pairs of jobs running on
+        # other pool threads into the same model calls
+        cats = dict(snapshot().categories)
+        res = classify_text_by_categories(text, cats, top_k=3)
+        applied = {cat: [x["label"] for x in info["top_k"]] for cat, info in res.items()}
+        write_result(job_id, {"applied": applied, "raw": res})
+        os.remove(path)
+        print(f"[worker] done {job_id} -> outbox")
+    except Exception as e:
+        fail(path, name, job, e)
+
+def _attempts(job: Dict | None) -> int:
+    """Attempts recorded in the job so far; 0 when missing or not a number."""
+    try:
+        return max(int((job or {}).get("attempts", 0)), 0)
+    except (TypeError, ValueError):
+        return 0
+
+def _requeue(path: str, name: str):
+    try:
+        os.replace(path, os.path.join(INBOX, name))
+    except OSError as e:
+        # left in PROCESSING: recover_orphans requeues it on the next worker start
+        print(f"[worker] WARNING: could not requeue {name}, left in {PROCESSING} for recovery: {e}")
+
+def fail(path: str, name: str, job: Dict | None, error: Exception):
+    if not isinstance(job, dict):
+        job = None
+    attempts = _attempts(job) + 1
+    permanent = isinstance(error, PermanentJobError) or job is None
+    if permanent or attempts >= WORKER_MAX_ATTEMPTS:
+        dead = os.path.join(DEADLETTER, name)
+        try:
+            if job is None:
+                os.replace(path, dead)  # unreadable: keep the original bytes
+            else:
+                _write_json(dead, {**job, "attempts": attempts, "last_error": str(error)})
+                os.remove(path)
+        except OSError as e:
+            print(f"[worker] WARNING: could not dead-letter {name}, left in {PROCESSING} for recovery: {e}")
+            return
+        if job is None:
+            try:
+                _write_json(dead + ".error.json", {"error": str(error), "attempts": attempts})
+            except OSError as e:
+                print(f"[worker] WARNING: could not write the error file for {name}: {e}")
+        print(f"[worker] dead-lettered {name} after {attempts} attempt(s): {error}")
+        return
+    try:
+        _write_json(path, {**job, "attempts": attempts, "last_error": str(error)})
+    except OSError as e:
+        # not requeued without its attempt count (it could then retry forever)
+        print(f"[worker] WARNING: could not record attempt {attempts} of {name}, left in {PROCESSING} for recovery: {e}")
+        return
+    print(f"[worker] error on {name} (attempt {attempts}/{WORKER_MAX_ATTEMPTS}), retrying in {WORKER_RETRY_DELAY_SEC}s: {error}")
+    # stays in PROCESSING until then, so a crash in between still requeues it
+    t = threading.Timer(WORKER_RETRY_DELAY_SEC, _requeue, (path, name))
+    t.daemon = True
+    t.start()
+
+def main_loop(poll_sec: float | None = None):
     print("[worker] starting...")
-    cats = load_categories()
-    cats_mtime = last_modified()
-    print("[worker] categories loaded:", list(cats.keys()))
+    recover_orphans()
+    snap = snapshot()
+    print("[worker] categories loaded:", list(snap.categories.keys()))
+
+    wake = threading.Event()
+    inotify = watch_inbox(wake)
+    poll = poll_sec if poll_sec is not None else (max(WORKER_POLL_SEC, 5.0) if inotify else WORKER_POLL_SEC)
+    print(f"[worker] {WORKER_THREADS} threads, pickup via {'inotify' if inotify else 'polling'} (rescan every {poll}s)")
+
+    pool = ThreadPoolExecutor(max_workers=max(1, WORKER_THREADS), thread_name_prefix="worker")
+    slots = threading.Semaphore(max(1, WORKER_THREADS) * 2)  # bound claimed-but-unfinished jobs
+
+    def run(path: str, name: str):
+        try:
+            process(path, name)
+        finally:
+            slots.release()
 
     while True:
-        # hot-reload categories if admin edited them
-        new_mtime = last_modified()
-        if new_mtime != cats_mtime:
-            cats = load_categories()
-            cats_mtime = new_mtime
-            print("[worker] categories reloaded:", list(cats.keys()))
-
-        # process any pending jobs: *.json with {"id":"...", "text":"..."}
-        for path in glob.glob(os.path.join(INBOX, "*.json")):
-            try:
-                job = read_job(path)
-                job_id = job.get("id") or os.path.splitext(os.path.basename(path))[0]
-                text = job.get("text") or ""
-                if not text.strip():
-                    print(f"[worker] skip empty text in {path}")
-                    os.remove(path); continue
-
-                res = classify_text_by_categories(text, cats, top_k=3)
-                applied = {cat: [x["label"] for x in info["top_k"]] for cat, info in res.items()}
-                write_result(job_id, {"applied": applied, "raw": res})
-                print(f"[worker] done {job_id} -> outbox")
-            except Exception as e:
-                print(f"[worker] error on {path}: {e}")
-            finally:
-                # remove job file regardless (simple at-least-once)
-                try: os.remove(path)
-                except: pass
-
-        time.sleep(poll_sec)
+        # categories hot-reload through the config_store snapshot
+        current = snapshot()
+        if current.version != snap.version:
+            snap = current
+            print("[worker] categories reloaded:", list(snap.categories.keys()))
+
+        wake.clear()
+        for name in pending_jobs():
+            slots.acquire()
+            path = claim(name)
+            if path is None:
+                slots.release()
+                continue
+            pool.submit(run, path, name)
+        wake.wait(poll)
 
 if __name__ == "__main__":
-    main_loop()
\ No newline at end of file
+    main_loop()
@@ -0,0 +1,376 @@
+# Batched zero-shot NLI scoring shared by the classifiers.
+# The HF zero-shot pipeline runs one forward pass per call; here every
+# (premise, hypothesis) pair across all categories is flattened into padded
+# batches so a CV costs ceil(total_labels / batch_size) passes instead of one
+# pass per category.
+#
+# By default the premise is truncated to the first window that fits the model.
+# With an `aggregate` of "max" or "mean" (opt-in) the premise is split into
+# overlapping token windows that fit next to the longest hypothesis,
+# near-duplicate windows are dropped, all (window, label) pairs go through the
+# same batches and each label's score is aggregated over the windows. The
+# number of windows is bounded by a per-request budget of (window, label)
+# pairs, so the cost stays flat however long the CV is.
+import os
+import re
+import logging
+from typing import Dict, List, Tuple, Any
+
+import torch
+
+import batching
+import token_cache
+from label_index import INDEX as LABEL_INDEX
+
+logger = logging.getLogger("zero_shot")
+
+NLI_BATCH_SIZE = int(os.environ.get("NLI_BATCH_SIZE", "16"))
+# two_stage mode: labels per category that are re-ranked by the NLI model
+RERANK_TOP_N = int(os.environ.get("RERANK_TOP_N", "5"))
+MODES = ("nli", "two_stage", "pruned")
+# pruned mode: estimated NLI ceiling for a label none of whose words occur in
+# the text (its similarity is added on top), and labels scored per round
+PRUNE_CEILING = float(os.environ.get("PRUNE_CEILING", "0.5"))
+PRUNE_STEP = int(os.environ.get("PRUNE_STEP", "2"))
+# chunked premises: how per-window scores are combined ("none" = first window
+# only, the default), window overlap, Jaccard similarity (over token bigrams)
+# above which a window counts as a near-duplicate, a cap on windows per
+# document, and a cap on (window, label) pairs per request: a request with many
+# labels gets fewer windows (at least one)
+AGGREGATES = ("none", "max", "mean")
+CHUNK_AGGREGATE = os.environ.get("CHUNK_AGGREGATE", "none")
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_DEDUP_JACCARD = float(os.environ.get("CHUNK_DEDUP_JACCARD", "0.85"))
+CHUNK_MAX_WINDOWS = int(os.environ.get("CHUNK_MAX_WINDOWS", "8"))
+CHUNK_MAX_PAIRS = int(os.environ.get("CHUNK_MAX_PAIRS", "256"))
+
+
+def _nli_label_ids(model) -> Tuple[int, int]:
+    """Entailment/contradiction logit indices, resolved like the HF pipeline."""
+    entailment_id = -1
+    for label, idx in model.config.label2id.items():
+        if label.lower().startswith("entail"):
+            entailment_id = idx
+            break
+    contradiction_id = -1 if entailment_id == 0 else 0
+    return entailment_id, contradiction_id
+
+
+def max_input_length(pipe) -> int:
+    """Longest sequence the NLI model accepts (tokenizers without a limit report ~1e30)."""
+    limit = getattr(pipe.tokenizer, "model_max_length", None) or 0
+    if not limit or limit > 100_000:
+        limit = getattr(pipe.model.config, "max_position_embeddings", 512)
+    return int(limit)
+
+
+def build_pair(tokenizer, premise_ids: List[int], hypothesis_ids: List[int], max_length: int) -> Dict[str, List[int]]:
+    """Join pre-tokenized premise/hypothesis with special tokens, truncating the premise only."""
+    budget = max_length - tokenizer.num_special_tokens_to_add(pair=True) - len(hypothesis_ids)
+    premise_ids = premise_ids[:max(budget, 0)]
+    feature = {"input_ids": tokenizer.build_inputs_with_special_tokens(premise_ids, hypothesis_ids)}
+    if "token_type_ids" in tokenizer.model_input_names:
+        feature["token_type_ids"] = tokenizer.create_token_type_ids_from_sequences(premise_ids, hypothesis_ids)
+    return feature
+
+
+def _pad(tokenizer, features: List[Dict[str, List[int]]]) -> Dict[str, torch.Tensor]:
+    width = max(len(f["input_ids"]) for f in features)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    left = getattr(tokenizer, "padding_side", "right") == "left"
+    batch: Dict[str, List[List[int]]] = {"input_ids": [], "attention_mask": []}
+    if "token_type_ids" in features[0]:
+        batch["token_type_ids"] = []
+    for f in features:
+        n = width - len(f["input_ids"])
+        for key, fill in (("input_ids", pad_id), ("token_type_ids", 0)):
+            if key in batch:
+                batch[key].append([fill] * n + f[key] if left else f[key] + [fill] * n)
+        mask = [1] * len(f["input_ids"])
+        batch["attention_mask"].append([0] * n + mask if left else mask + [0] * n)
+    return {k: torch.tensor(v, dtype=torch.long) for k, v in batch.items()}
+
+
+def _bigrams(ids: List[int]) -> set:
+    return set(zip(ids, ids[1:])) or set(ids)
+
+
+def premise_chunks(pipe, text: str, hypothesis_len: int,
+                   max_windows: int | None = None) -> Tuple[List[List[int]], int]:
+    """
+    Overlapping token windows of `text` that fit the model next to a hypothesis
+    of `hypothesis_len` tokens, at most `max_windows` (default CHUNK_MAX_WINDOWS).
+    Returns (kept windows, number skipped as near-duplicates of an earlier window).
+    """
+    tokenizer = pipe.tokenizer
+    ids = token_cache.encode(tokenizer, text)
+    window = max_input_length(pipe) - tokenizer.num_special_tokens_to_add(pair=True) - hypothesis_len
+    window = max(window, 1)
+    if len(ids) <= window:
+        return [ids], 0
+    stride = max(window - min(CHUNK_OVERLAP_TOKENS, window // 2), 1)
+    kept: List[List[int]] = []
+    shingles: List[set] = []
+    skipped = 0
+    for start in range(0, len(ids), stride):
+        chunk = ids[start:start + window]
+        sh = _bigrams(chunk)
+        if any(len(sh & prev) / max(len(sh | prev), 1) >= CHUNK_DEDUP_JACCARD for prev in shingles):
+            skipped += 1
+        else:
+            kept.append(chunk)
+            shingles.append(sh)
+        if start + window >= len(ids):
+            break
+    cap = max(1, CHUNK_MAX_WINDOWS if max_windows is None else max_windows)
+    if len(kept) > cap:
+        # spread the budget over the whole document rather than keeping only its start
+        step = (len(kept) - 1) / (cap - 1) if cap > 1 else 0
+        kept = [kept[round(i * step)] for i in range(cap)]
+    return kept, skipped
+
+
+def _forward(pipe, features: List[Dict[str, List[int]]]) -> List[float]:
+    """One padded forward pass; entailment probability per feature."""
+    model, tokenizer = pipe.model, pipe.tokenizer
+    entailment_id, contradiction_id = _nli_label_ids(model)
+    inputs = _pad(tokenizer, features)
+    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    probs = logits[:, [contradiction_id, entailment_id]].softmax(dim=-1)[:, 1]
+    return [float(s) for s in probs.cpu()]
+
+
+def score_pairs(pipe, pairs: List[Tuple[str, str]], batch_size: int | None = None) -> List[float]:
+    """
+    Entailment probability for each (premise, label) pair, equivalent to the
+    pipeline's multi_label=True scores. Pairs are run in padded batches; each
+    premise is tokenized once via token_cache and label hypotheses come
+    precomputed from the label index. With micro-batching enabled the pairs
+    are handed to the model's shared batcher, so concurrent requests fill the
+    same batches.
+    """
+    if not pairs:
+        return []
+    tokenizer = pipe.tokenizer
+    max_length = max_input_length(pipe)
+
+    with token_cache.scope():
+        features = [
+            build_pair(tokenizer, token_cache.encode(tokenizer, p), LABEL_INDEX.hypothesis_ids(tokenizer, lbl), max_length)
+            for p, lbl in pairs
+        ]
+    return _score_features(pipe, features, batch_size)
+
+
+def _score_features(pipe, features: List[Dict[str, List[int]]], batch_size: int | None = None) -> List[float]:
+    model = pipe.model
+    if batching.enabled():
+        name = f"nli:{getattr(model, 'name_or_path', type(model).__name__)}"
+        batcher = batching.get_batcher(name, lambda: batching.MicroBatcher(
+            name, lambda items: _forward(pipe, items), NLI_BATCH_SIZE))
+        return batcher.submit_many(features)
+
+    batch_size = max(1, int(batch_size or NLI_BATCH_SIZE))
+    scores: List[float] = []
+    for start in range(0, len(features), batch_size):
+        scores.extend(_forward(pipe, features[start:start + batch_size]))
+    return scores
+
+
+def window_budget(total_labels: int) -> int:
+    """Windows per document for a request scoring `total_labels` labels (CHUNK_MAX_PAIRS / labels)."""
+    return max(1, min(CHUNK_MAX_WINDOWS, CHUNK_MAX_PAIRS // max(1, total_labels)))
+
+
+def score_chunked(pipe, text: str, labels: List[str], aggregate: str = "max",
+                  batch_size: int | None = None, details: Dict[str, Any] | None = None,
+                  hypothesis_len: int | None = None, max_windows: int | None = None) -> List[float]:
+    """
+    Score each label against every token window of `text` (one batched run for
+    all windows x labels) and combine the per-window scores with `aggregate`.
+    Windows are sized for `hypothesis_len` (default: the longest of `labels`);
+    `max_windows` defaults to window_budget(len(labels)).
+    Window counts are written to `details` when given.
+    """
+    if aggregate not in ("max", "mean"):
+        raise ValueError(f"Unknown aggregate: {aggregate}")
+    if not labels:
+        return []
+    tokenizer = pipe.tokenizer
+    max_length = max_input_length(pipe)
+    with token_cache.scope():
+        hyps = [LABEL_INDEX.hypothesis_ids(tokenizer, lbl) for lbl in labels]
+        chunks, skipped = premise_chunks(pipe, text, hypothesis_len or max(len(h) for h in hyps),
+                                         window_budget(len(labels)) if max_windows is None else max_windows)
+    if details is not None:
+        details.update(windows=len(chunks), duplicate_windows_skipped=skipped)
+    features = [build_pair(tokenizer, chunk, hyp, max_length) for chunk in chunks for hyp in hyps]
+    flat = _score_features(pipe, features, batch_size)
+    n = len(labels)
+    per_label = [flat[i::n] for i in range(n)]  # window-major order -> every n-th score is the same label
+    if aggregate == "max":
+        return [max(s) for s in per_label]
+    return [sum(s) / len(s) for s in per_label]
+
+
+def _ceilings(text: str, labels: List[str]) -> List[float]:
+    """
+    Cheap per-label estimate of the best NLI score a label could reach: 1.0 when
+    any of its words occurs in the text (the same signal as bart_model's
+    heuristic score_label), otherwise PRUNE_CEILING plus its TF-IDF similarity.
+    """
+    words = set(re.findall(r"\w+", text.lower()))
+    sims = LABEL_INDEX.similarity(text, labels)
+    out = []
+    for label, sim in zip(labels, sims):
+        hit = any(w in words for w in re.findall(r"\w+", label.lower()) if len(w) > 1)
+        out.append(1.0 if hit else min(1.0, PRUNE_CEILING + sim))
+    return out
+
+
+def _score_pruned(pipe, text: str, index: List[Tuple[str, str]], top_k: int, score_fn,
+                  details: Dict[str, Any] | None = None) -> Dict[str, List[Tuple[str, float, str]]]:
+    """
+    Score labels in rounds, most promising first. A category stops once it has
+    top_k NLI scores and its k-th best is at least the ceiling of every label it
+    has not scored yet; those labels are returned with stage "pruned" and their
+    ceiling as score. Each round is one batched call across all open categories.
+    """
+    ceilings = _ceilings(text, [label for _, label in index])
+    queues: Dict[str, List[Tuple[str, float]]] = {}
+    for (cat, label), ceiling in zip(index, ceilings):
+        queues.setdefault(cat, []).append((label, ceiling))
+    for queue in queues.values():
+        queue.sort(key=lambda p: p[1], reverse=True)
+
+    scored: Dict[str, List[Tuple[str, float, str]]] = {cat: [] for cat in queues}
+    k = max(1, int(top_k))
+    rounds = 0
+    while True:
+        batch: List[Tuple[str, str]] = []
+        for cat, queue in queues.items():
+            if not queue:
+                continue
+            done = sorted((sc for _, sc, _ in scored[cat]), reverse=True)
+            if len(done) >= k and done[k - 1] >= queue[0][1]:
+                continue  # no remaining label can enter the top-k
+            # first round fills the top-k, later rounds take PRUNE_STEP more
+            take = max(k - len(done), max(1, PRUNE_STEP))
+            batch.extend((cat, label) for label, _ in queue[:take])
+            del queue[:take]
+        if not batch:
+            break
+        rounds += 1
+        for (cat, label), score in zip(batch, score_fn([label for _, label in batch])):
+            scored[cat].append((label, score, "nli"))
+
+    pruned = 0
+    for cat, queue in queues.items():
+        scored[cat].extend((label, ceiling, "pruned") for label, ceiling in queue)
+        pruned += len(queue)
+    if details is not None:
+        details.update(rounds=rounds, pruned_labels=pruned)
+    return scored
+
+
+def _classify_with_pipeline(pipe, text: str, categories: Dict[str, List[str]]) -> Dict[str, Dict[str, List[Any]]]:
+    """Old one-call-per-category path, kept as a fallback."""
+    out = {}
+    for cat, labels in categories.items():
+        if not labels:
+            continue
+        try:
+            res = pipe(text, candidate_labels=labels, multi_label=True)
+        except Exception as e:
+            logger.warning("Classification failed for %s: %s", cat, e)
+            continue
+        scores = [float(s) for s in res.get("scores", [])]
+        out[cat] = {"labels": list(res.get("labels", [])), "scores": scores, "stages": ["nli"] * len(scores)}
+    return out
+
+
+def classify_categories(pipe, text: str, categories: Dict[str, List[str]],
+                        batch_size: int | None = None, mode: str = "nli",
+                        rerank_top: int | None = None, aggregate: str | None = None,
+                        details: Dict[str, Any] | None = None,
+                        top_k: int = 3) -> Dict[str, Dict[str, List[Any]]]:
+    """
+    Score every label of every category against `text` in batched forward passes.
+    Returns {category: {"labels": [...], "scores": [...], "stages": [...]}} sorted
+    by score (desc), the same shape the pipeline returns per call plus the stage
+    that produced each score. Empty categories are skipped.
+
+    mode="nli":       every label goes through the NLI model.
+    mode="two_stage": labels are ranked by TF-IDF cosine against the precomputed
+                      label vectors and only the top `rerank_top` per category
+                      are re-scored by NLI; the rest keep their similarity score.
+    mode="pruned":    labels are scored most-promising-first and a category stops
+                      once its `top_k` can no longer change (see _score_pruned);
+                      skipped labels are returned with stage "pruned".
+
+    With `aggregate` "max"/"mean" the whole text is scored in overlapping token
+    windows (see score_chunked), as many as window_budget() allows for all the
+    labels of the request; with None or "none" the premise is truncated to one window.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown classification mode: {mode}")
+    if aggregate is not None and aggregate not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate: {aggregate}")
+    if aggregate == "none":
+        aggregate = None
+
+    index: List[Tuple[str, str]] = []
+    for cat, labels in categories.items():
+        for label in labels or []:
+            index.append((cat, label))
+    if not index:
+        return {}
+    # the window budget covers every label of the request, whichever round or stage scores them
+    max_windows = window_budget(len(index))
+
+    grouped: Dict[str, List[Tuple[str, float, str]]] = {}
+    to_score = index
+    if mode == "two_stage":
+        top_n = max(1, int(rerank_top or RERANK_TOP_N))
+        sims = LABEL_INDEX.similarity(text, [label for _, label in index])
+        by_cat: Dict[str, List[Tuple[str, float]]] = {}
+        for (cat, label), sim in zip(index, sims):
+            by_cat.setdefault(cat, []).append((label, sim))
+        to_score = []
+        for cat, ranked in by_cat.items():
+            ranked.sort(key=lambda p: p[1], reverse=True)
+            to_score.extend((cat, label) for label, _ in ranked[:top_n])
+            grouped[cat] = [(label, sim, "similarity") for label, sim in ranked[top_n:]]
+
+    def score_fn(labels: List[str]) -> List[float]:
+        if aggregate:
+            return score_chunked(pipe, text, labels, aggregate, batch_size, details, hypothesis_len, max_windows)
+        return score_pairs(pipe, [(text, label) for label in labels], batch_size)
+
+    try:
+        with token_cache.scope():
+            # chunk windows are sized for the longest hypothesis of the whole request,
+            # so every round of the pruned mode sees the same windows
+            hypothesis_len = max(len(LABEL_INDEX.hypothesis_ids(pipe.tokenizer, label)) for _, label in index)
+            if mode == "pruned":
+                grouped = _score_pruned(pipe, text, index, top_k, score_fn, details)
+            else:
+                scores = score_fn([label for _, label in to_score])
+                for (cat, label), score in zip(to_score, scores):
+                    grouped.setdefault(cat, []).append((label, score, "nli"))
+    except Exception as e:
+        logger.warning("Batched classification failed, falling back to per-category calls: %s", e)
+        return _classify_with_pipeline(pipe, text, categories)
+
+    out = {}
+    for cat, scored in grouped.items():
+        # NLI-scored labels rank ahead of similarity-only and pruned ones
+        scored.sort(key=lambda p: (p[2] == "nli", p[1]), reverse=True)
+        out[cat] = {
+            "labels": [lbl for lbl, _, _ in scored],
+            "scores": [sc for _, sc, _ in scored],
+            "stages": [st for _, _, st in scored],
+        }
+    return out